@@ -7,137 +7,264 @@ This module handles:
 3. Background stream processing with occupancy detection
 """
 
+import logging
 import os
 import time
-import cv2
-import av
 from datetime import datetime
 
-def capture_frame_from_stream(stream_url):
+import numpy as np
+
+from seat_table import SeatTable
+from motion import motion_per_box
+
+# cv2 and av are imported inside the functions below so that importing this
+# module does not pull them in before the server's startup phase does.
+
+log = logging.getLogger("capture")
+# One record per packet / per seat; rate limited by log_config
+packet_log = logging.getLogger("capture.packets")
+seat_log = logging.getLogger("capture.seats")
+
+# Wall-clock budget for reading packets in one capture. PyAV's read timeout
+# only bounds each I/O call, so a live source that never sends a video
+# keyframe (audio-only URL, broken encoder) would otherwise be read forever.
+MAX_CAPTURE_SECONDS = 15
+
+
+def capture_frame_from_stream(stream_url, timeout=None, max_seconds=MAX_CAPTURE_SECONDS):
+    """Decode the first keyframe of a stream as a BGR ndarray, or None.
+    
+    timeout is passed to av.open: seconds, or an (open, read) tuple. Without
+    it an unreachable source can block indefinitely. Packets are read for at
+    most max_seconds after the source is open.
+    """
+    import av
+    
     frame_img = None
-    video = av.open(stream_url, 'r')
-    for packet in video.demux():
-        print(f"Demuxing packet {packet}")
-        for frame in packet.decode():
-            print(f"Decoding frame {frame}")
-            if type(frame) is av.video.frame.VideoFrame:
-                if frame.key_frame:
-                    frame_img = frame.to_ndarray(format='bgr24')
-                    # Close Connection to RTSP Source
-                    break
-        if frame_img is not None:
-            break
+    debug = packet_log.isEnabledFor(logging.DEBUG)
+    video = av.open(stream_url, 'r', timeout=timeout)
+    deadline = time.monotonic() + max_seconds
+    try:
+        for packet in video.demux():
+            if time.monotonic() > deadline:
+                log.warning("No keyframe within %ss", max_seconds, extra={"url": stream_url})
+                break
+            if debug:
+                packet_log.debug("Demuxing packet", extra={"pts": packet.pts, "size": packet.size})
+            for frame in packet.decode():
+                if debug:
+                    packet_log.debug("Decoding frame", extra={"pts": frame.pts, "key_frame": frame.key_frame})
+                if type(frame) is av.video.frame.VideoFrame:
+                    if frame.key_frame:
+                        frame_img = frame.to_ndarray(format='bgr24')
+                        break
+            if frame_img is not None:
+                break
+    finally:
+        # Close Connection to RTSP Source
+        video.close()
 
-    if not video or frame_img is None:
-        return None
     return frame_img
-    #except Exception as e:
-    #    print(f"Error capturing frame: {e}")
-    #    return None
+
+
+def capture_frame_with_motion(stream_url, boxes, sample_frames, timeout=None,
+                              max_seconds=MAX_CAPTURE_SECONDS):
+    """Grab a keyframe and the codec motion inside each box, without converting it.
+    
+    Motion vectors are read from every inter frame the session decodes: those
+    before the keyframe and up to sample_frames after it, within max_seconds.
+    Returns (keyframe, motion) where keyframe is a PyAV VideoFrame (or None);
+    the caller converts it to an ndarray only if some seat needs a prediction.
+    """
+    import av
+    import numpy as np
+    
+    motion = np.zeros(len(boxes), dtype=np.float64)
+    key_frame = None
+    frames_after_key = 0
+    with av.open(stream_url, 'r', timeout=timeout) as video:
+        deadline = time.monotonic() + max_seconds
+        stream = video.streams.video[0]
+        stream.codec_context.options = {"flags2": "+export_mvs"}
+        for packet in video.demux(stream):
+            if time.monotonic() > deadline:
+                if key_frame is None:
+                    log.warning("No keyframe within %ss", max_seconds, extra={"url": stream_url})
+                break
+            for frame in packet.decode():
+                vectors = frame.side_data.get("MOTION_VECTORS")
+                if vectors is not None:
+                    motion += motion_per_box(vectors.to_ndarray(), boxes, frame.width, frame.height)
+                if key_frame is None:
+                    if frame.key_frame:
+                        key_frame = frame
+                else:
+                    frames_after_key += 1
+            if key_frame is not None and frames_after_key >= sample_frames:
+                break
+    return key_frame, motion
+
+
+def seat_crops(frame, layout, seat_indices):
+    """Yield (i, image, source) for each listed seat of a SeatLayout.
+    
+    image is the seat's camera region, or the full frame when the seat has no
+    camera mapping or its region lies outside the frame. This is the one crop
+    rule, shared by the live sweep and the rescore CLI.
+    """
+    frame_height, frame_width = frame.shape[:2]
+    boxes = layout.clipped_camera_boxes(frame_width, frame_height)
+    for i in seat_indices:
+        # If camera coordinates exist, crop that region for prediction
+        if not layout.has_camera[i]:
+            yield i, frame, "full frame - no mapping"
+            continue
+        x1, y1, x2, y2 = boxes[i].tolist()
+        cropped_frame = frame[y1:y2, x1:x2]
+        if cropped_frame.size > 0:
+            yield i, cropped_frame, "camera region"
+        else:
+            # Fallback to full frame if crop fails
+            yield i, frame, "full frame - crop failed"
 
 
 def save_screenshot(frame, stream_id, screenshots_dir):
     """Save a frame as a screenshot."""
+    import cv2
+    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     screenshot_path = os.path.join(screenshots_dir, f"{stream_id}_{timestamp}.jpg")
     cv2.imwrite(screenshot_path, frame)
-    print(f"Screenshot saved: {screenshot_path}")
+    log.debug("Screenshot saved: %s", screenshot_path)
     return screenshot_path
 
 
-def process_stream(stream_id, stream_url, active_streams, occupancy_data, 
+def _predict_seats(frame, table, seat_indices, predict_fn):
+    """Run predict_fn on each listed seat's camera region and record it in the table."""
+    layout = table.layout
+    now = time.time()
+    debug = seat_log.isEnabledFor(logging.DEBUG)
+    for i, image, source in seat_crops(frame, layout, seat_indices):
+        prediction = predict_fn(image)
+        if debug:
+            seat_log.debug("Predicted seat", extra={
+                "seat": layout.records[i]["label"],
+                "status": prediction["class_name"],
+                "confidence": prediction["confidence"],
+                "source": source,
+            })
+        table.update(i, prediction, now)
+
+
+def process_stream(stream_id, stream_url, active_streams, occupancy_store, 
                    coordinates, screenshots_dir, screenshot_interval,
-                   predict_fn, mongo=None, mongo_available=False):
-    """Background thread: capture frames and run detection periodically."""
-    print(f"Starting stream processing for {stream_id}: {stream_url}")
+                   predict_fn, mongo=None, mongo_available=False, publish_fn=None,
+                   frame_fn=None, motion_gate=None, capture_timeout=None,
+                   idle_frame_interval=120, capture_max_seconds=MAX_CAPTURE_SECONDS):
+    """Background thread: capture frames and run detection periodically.
+    
+    Seat state lives in a SeatTable updated in place; each sweep publishes a copy
+    of it to occupancy_store as a new snapshot, and publish_fn(stream_id, snapshot)
+    is then called with that snapshot. frame_fn(stream_id, frame) receives every
+    captured frame. None of them is called once the stream has been stopped,
+    so a sweep that was running at the time does not bring its state back.
+    
+    With a MotionGate, codec motion vectors decide which seats are re-classified.
+    The keyframe and the sampled inter frames are still decoded on every sweep
+    (the motion vectors come from decoding); a sweep in which no seat moved
+    skips the keyframe's conversion to an ndarray, the screenshot and inference.
+    It still calls publish_fn with the unchanged snapshot, so per-sweep
+    consumers such as the heatmap keep advancing, and frame_fn with
+    frame=None ("the last frame is still current"), or with the converted
+    keyframe once every idle_frame_interval seconds.
+    """
+    log.info("Starting stream processing", extra={"stream_id": stream_id, "url": stream_url})
     
-    while stream_id in active_streams and active_streams[stream_id].get('active', False):
+    # Keep a reference to our own entry so a stream that is stopped and
+    # restarted under the same id does not keep this thread alive
+    stream_info = active_streams.get(stream_id)
+    
+    def running():
+        return active_streams.get(stream_id) is stream_info and stream_info.get('active', False)
+    
+    # Seat layout and in-place state, rebuilt when the coordinates change
+    table = None
+    table_coords = None
+    table_version = None
+    snapshot = None
+    last_frame_at = 0.0
+    
+    while stream_info is not None and running():
         try:
-            frame = capture_frame_from_stream(stream_url)
+            # Get latest coordinates from active_streams (may have been updated with camera coords)
+            current_coords = stream_info.get('coordinates', coordinates)
+            layout_version = stream_info.get('layout_version', 0)
+            
+            # Rebuild the seat table only when the layout changed
+            if table is None or current_coords is not table_coords or layout_version != table_version:
+                table = SeatTable(current_coords, previous=table)
+                table_coords, table_version = current_coords, layout_version
             
+            if motion_gate is not None:
+                # Only convert the keyframe and classify seats whose camera box saw motion
+                key_frame, motion = capture_frame_with_motion(
+                    stream_url, motion_gate.boxes(table.layout), motion_gate.sample_frames,
+                    timeout=capture_timeout, max_seconds=capture_max_seconds
+                )
+                motion_gate.add(table.layout, motion)
+                flagged = motion_gate.flagged(table, time.time()) if key_frame is not None else None
+                if not running():
+                    break
+                if flagged is not None and not flagged.any():
+                    now = time.time()
+                    if frame_fn:
+                        if now - last_frame_at >= idle_frame_interval:
+                            frame_fn(stream_id, key_frame.to_ndarray(format='bgr24'))
+                            last_frame_at = now
+                        else:
+                            frame_fn(stream_id, None)
+                    if publish_fn and snapshot is not None:
+                        publish_fn(stream_id, snapshot)
+                    log.debug("No motion: skipped predictions",
+                              extra={"stream_id": stream_id, "seats": len(table)})
+                    time.sleep(screenshot_interval)
+                    continue
+                frame = key_frame.to_ndarray(format='bgr24') if key_frame is not None else None
+                seat_indices = np.flatnonzero(flagged).tolist() if flagged is not None else []
+            else:
+                frame = capture_frame_from_stream(stream_url, timeout=capture_timeout,
+                                                  max_seconds=capture_max_seconds)
+                seat_indices = range(len(table))
+            
+            # The capture can take seconds; the stream may have been stopped meanwhile
+            if not running():
+                break
             if frame is not None:
                 # Save screenshot
                 screenshot_path = save_screenshot(frame, stream_id, screenshots_dir)
+                if frame_fn:
+                    frame_fn(stream_id, frame)
+                    last_frame_at = time.time()
                 
-                # Get frame dimensions
-                frame_height, frame_width = frame.shape[:2]
-                
-                # Get latest coordinates from active_streams (may have been updated with camera coords)
-                current_coords = active_streams[stream_id].get('coordinates', coordinates)
-                
-                # Update occupancy data for each seat
-                seats_data = []
-                for coord in current_coords:
-                    seat_id = coord.get("id", "unknown")
-                    
-                    # Check if seat has camera coordinates (mappings from Feed Selection)
-                    camera_x = coord.get("camera_x")
-                    camera_y = coord.get("camera_y")
-                    camera_width = coord.get("camera_width")
-                    camera_height = coord.get("camera_height")
-                    
-                    print(f"  🔍 Seat {coord.get('label', seat_id)}: camera_x={camera_x}, camera_y={camera_y}, camera_w={camera_width}, camera_h={camera_height}")
-                    
-                    # If camera coordinates exist, crop that region for prediction
-                    if all(v is not None for v in [camera_x, camera_y, camera_width, camera_height]) and camera_width > 0 and camera_height > 0:
-                        # Ensure coordinates are within frame bounds
-                        x1 = max(0, int(camera_x))
-                        y1 = max(0, int(camera_y))
-                        x2 = min(frame_width, int(camera_x + camera_width))
-                        y2 = min(frame_height, int(camera_y + camera_height))
-                        
-                        print(f"  ✅ Cropping [{y1}:{y2}, {x1}:{x2}] from {frame_width}x{frame_height} frame")
-                        
-                        # Crop the region
-                        cropped_frame = frame[y1:y2, x1:x2]
-                        
-                        if cropped_frame.size > 0:
-                            # Run prediction on cropped region
-                            prediction = predict_fn(cropped_frame)
-                            print(f"Predicted seat {coord.get('label', seat_id)}: {prediction['class_name']} (camera region)")
-                        else:
-                            # Fallback to full frame if crop fails
-                            prediction = predict_fn(frame)
-                            print(f"Predicted seat {coord.get('label', seat_id)}: {prediction['class_name']} (full frame - crop failed)")
-                    else:
-                        # No camera coordinates, use full frame prediction
-                        prediction = predict_fn(frame)
-                        print(f"  ❌ No camera coords → full frame prediction")
-                        print(f"Predicted seat {coord.get('label', seat_id)}: {prediction['class_name']} (full frame - no mapping)")
-                    
-                    # Build seat result with all coordinates
-                    seat_result = {
-                        "id": seat_id,
-                        # Floorplan coordinates
-                        "x": coord.get("x", 0),
-                        "y": coord.get("y", 0),
-                        "width": coord.get("width", 0),
-                        "height": coord.get("height", 0),
-                        # Camera coordinates
-                        "camera_x": camera_x,
-                        "camera_y": camera_y,
-                        "camera_width": camera_width,
-                        "camera_height": camera_height,
-                        # Seat info
-                        "label": coord.get("label", "Unknown"),
-                        # Prediction result
-                        "status": prediction["class_index"],
-                        "status_name": prediction["class_name"],
-                        "confidence": prediction["confidence"]
-                    }
-                    occupancy_data[stream_id][seat_id] = seat_result
-                    seats_data.append(seat_result)
+                # Update occupancy state for each seat in place
+                _predict_seats(frame, table, seat_indices, predict_fn)
+                if not running():
+                    break
                 
-                # Occupancy data is kept in-memory only (not persisted to MongoDB)
-                # This avoids storing large amounts of historical data
+                # Only the latest sweep is published (no history is stored)
+                snapshot = occupancy_store.publish(stream_id, table.copy())
+                if publish_fn:
+                    publish_fn(stream_id, snapshot)
                 
-                print(f"Occupancy updated for {stream_id}: {len(seats_data)} seats processed")
+                log.info("Occupancy updated", extra={
+                    "stream_id": stream_id, "processed": len(seat_indices), "seats": len(table)
+                })
             else:
-                print(f"No frame captured for {stream_id}")
-        except Exception as e:
-            print(f"Error processing stream {stream_id}: {e}")
+                log.warning("No frame captured", extra={"stream_id": stream_id})
+        except Exception:
+            log.exception("Error processing stream", extra={"stream_id": stream_id})
         
         time.sleep(screenshot_interval)
     
-    print(f"Stream processing stopped for {stream_id}")
+    log.info("Stream processing stopped", extra={"stream_id": stream_id})
 
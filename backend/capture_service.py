@@ -0,0 +1,84 @@
+"""
+Capture Service Module
+
+This module handles:
+1. Running request-triggered frame grabs on a bounded thread pool
+2. Coalescing concurrent grabs of the same URL into one in-flight capture
+3. Per-call deadlines, so a handler gives up instead of hanging on a dead source
+
+A worker thread is bounded separately from the handler's deadline: opening
+the source by PyAV's open timeout, each read by its read timeout, and the
+search for a keyframe by max_seconds of wall-clock time. The read timeout
+alone is per I/O call, so a source that keeps sending packets without a video
+keyframe would hold the thread forever.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from capture import capture_frame_from_stream, MAX_CAPTURE_SECONDS
+
+log = logging.getLogger("capture_service")
+
+
+class CaptureTimeout(Exception):
+    """The frame did not arrive before the caller's deadline."""
+
+
+class CaptureUnavailable(Exception):
+    """Every capture slot is busy; the caller should retry later."""
+
+
+class CaptureService:
+    """Bounded, coalescing executor for capture_frame_from_stream."""
+
+    def __init__(self, max_workers=4, max_pending=16, open_timeout=5, read_timeout=5,
+                 max_seconds=MAX_CAPTURE_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="capture")
+        # Captures queued or running; beyond this new URLs are refused instead of queued
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._inflight = {}  # stream_url -> Future
+        self._lock = threading.Lock()
+        self.timeout = (open_timeout, read_timeout)
+        self.max_seconds = max_seconds
+
+    def submit(self, stream_url):
+        """Future of a frame for stream_url, shared with any capture already running."""
+        with self._lock:
+            future = self._inflight.get(stream_url)
+            if future is not None:
+                return future
+            if not self._slots.acquire(blocking=False):
+                raise CaptureUnavailable("Too many captures in flight")
+            future = self._executor.submit(capture_frame_from_stream, stream_url,
+                                           self.timeout, self.max_seconds)
+            self._inflight[stream_url] = future
+        future.add_done_callback(lambda f: self._finish(stream_url, f))
+        return future
+
+    def _finish(self, stream_url, future):
+        with self._lock:
+            if self._inflight.get(stream_url) is future:
+                del self._inflight[stream_url]
+        self._slots.release()
+
+    def grab(self, stream_url, deadline):
+        """Wait up to deadline seconds for a frame (None if the source gave none).
+
+        Raises CaptureTimeout when the deadline passes; the capture keeps running
+        and later callers for the same URL join it.
+        """
+        future = self.submit(stream_url)
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeoutError:
+            raise CaptureTimeout(f"No frame from {stream_url} within {deadline}s")
+        except Exception as e:
+            # Connection errors, PyAV open/read timeouts: same as getting no frame
+            log.warning("Error capturing frame: %s", e, extra={"url": stream_url})
+            return None
+
+    def in_flight(self):
+        return len(self._inflight)
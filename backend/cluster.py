@@ -0,0 +1,273 @@
+"""
+Cluster Coordination Module
+
+This module handles:
+1. Node heartbeats in the `nodes` collection
+2. Stream ownership through leases on documents in the `streams` collection
+3. Rebalancing streams across live nodes when nodes join or leave
+4. Sharing the latest occupancy of every stream through the `occupancy` collection
+
+The `streams` collection stays the source of truth: a stream is processed by
+the node named in its `owner` field for as long as that node keeps renewing
+`lease_expires`. Every node mirrors the occupancy of streams it does not own,
+so any node can answer the occupancy endpoints.
+"""
+
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+# Fields added to stream documents by the coordinator, not part of the stream config
+LEASE_FIELDS = ("owner", "lease_expires")
+
+log = logging.getLogger("cluster")
+
+
+class ClusterCoordinator:
+    """Claims, renews and releases stream leases for one backend node."""
+
+    def __init__(self, db, node_id, start_stream, stop_stream, update_stream=None,
+                 on_remote_occupancy=None, on_remote_sweep=None, node_url=None,
+                 heartbeat_interval=5, lease_ttl=15, max_claims_per_tick=None):
+        self.db = db
+        self.node_id = node_id
+        self.node_url = node_url
+        self.start_stream = start_stream
+        self.stop_stream = stop_stream
+        self.update_stream = update_stream
+        self.on_remote_occupancy = on_remote_occupancy
+        # Called with a stream id when its owner swept without changing the seats
+        self.on_remote_sweep = on_remote_sweep
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_ttl = lease_ttl
+        # Caps how many streams are started per heartbeat so a cold cluster
+        # resumes its streams in waves rather than all at once
+        self.max_claims_per_tick = max_claims_per_tick
+
+        self.known_streams = {}    # stream_id -> stream document (all nodes)
+        self.live_nodes = []       # node ids with a fresh heartbeat
+        self._running = set()      # stream ids processed on this node
+        self._mirrored = {}        # stream_id -> (changed_at, updated_at) of the mirrored occupancy
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # Lifecycle
+
+    def start(self):
+        """Join the cluster and start the heartbeat/rebalance loop."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        log.info("Cluster node joined", extra={"node_id": self.node_id})
+
+    def stop(self):
+        """Release every lease held by this node and leave the cluster."""
+        self._stop_event.set()
+        with self._lock:
+            for stream_id in list(self._running):
+                self._release(stream_id)
+            self.db.nodes.delete_one({"_id": self.node_id})
+        log.info("Cluster node left", extra={"node_id": self.node_id})
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self._lock:
+                    self._tick()
+            except Exception:
+                log.exception("Cluster tick failed", extra={"node_id": self.node_id})
+            self._stop_event.wait(self.heartbeat_interval)
+
+    # Rebalancing
+
+    def _tick(self):
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_ttl)
+
+        # 1. Heartbeat and renew every lease this node still holds
+        self.db.nodes.update_one(
+            {"_id": self.node_id},
+            {"$set": {"heartbeat_at": now, "url": self.node_url}},
+            upsert=True
+        )
+        self.db.streams.update_many(
+            {"owner": self.node_id},
+            {"$set": {"lease_expires": lease_until}}
+        )
+
+        # 2. Read cluster state
+        cutoff = now - timedelta(seconds=self.lease_ttl)
+        self.live_nodes = sorted(
+            doc["_id"] for doc in self.db.nodes.find({"heartbeat_at": {"$gte": cutoff}}, {"_id": 1})
+        )
+        if self.node_id not in self.live_nodes:
+            self.live_nodes.append(self.node_id)
+        self.known_streams = {
+            doc["_id"]: doc for doc in self.db.streams.find({"url": {"$exists": True}})
+        }
+
+        owned = sorted(
+            stream_id for stream_id, doc in self.known_streams.items()
+            if doc.get("owner") == self.node_id
+        )
+
+        # 3. Stop workers for streams that were deleted or taken over
+        for stream_id in list(self._running):
+            if stream_id not in owned:
+                self._running.discard(stream_id)
+                self.stop_stream(stream_id)
+
+        # 4. Release streams above this node's fair share
+        target = math.ceil(len(self.known_streams) / len(self.live_nodes))
+        while len(owned) > target:
+            self._release(owned.pop())
+
+        # 5. Claim free or expired streams up to the fair share
+        claims = 0
+        if len(owned) < target:
+            for stream_id, doc in self.known_streams.items():
+                if len(owned) >= target:
+                    break
+                if self.max_claims_per_tick and claims >= self.max_claims_per_tick:
+                    break
+                if doc.get("owner") == self.node_id:
+                    continue
+                lease_expires = doc.get("lease_expires")
+                if doc.get("owner") and lease_expires and lease_expires >= now:
+                    continue
+                claimed = self._claim(stream_id, now, lease_until)
+                if claimed is not None:
+                    self.known_streams[stream_id] = claimed
+                    owned.append(stream_id)
+                    claims += 1
+
+        # 6. Start new workers and push config changes to running ones
+        for stream_id in owned:
+            doc = self.known_streams[stream_id]
+            if stream_id not in self._running:
+                self._running.add(stream_id)
+                self._mirrored.pop(stream_id, None)
+                self.start_stream(stream_config(doc))
+            elif self.update_stream:
+                self.update_stream(stream_config(doc))
+
+        # 7. Mirror the occupancy of streams owned by other nodes
+        self._mirror_occupancy()
+
+    def _claim(self, stream_id, now, lease_until):
+        """Atomically take a stream that is unowned or whose lease has expired."""
+        return self.db.streams.find_one_and_update(
+            {"_id": stream_id, "$or": [
+                {"owner": None},
+                {"lease_expires": {"$lt": now}},
+            ]},
+            {"$set": {"owner": self.node_id, "lease_expires": lease_until}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _release(self, stream_id):
+        """Give up a stream so another node can claim it straight away."""
+        self.db.streams.update_one(
+            {"_id": stream_id, "owner": self.node_id},
+            {"$set": {"owner": None, "lease_expires": None}}
+        )
+        if stream_id in self._running:
+            self._running.discard(stream_id)
+            self.stop_stream(stream_id)
+
+    def _mirror_occupancy(self):
+        if not self.on_remote_occupancy:
+            return
+        remote_ids = [sid for sid in self.known_streams if sid not in self._running]
+        # Compare timestamps first and only download the seats that changed.
+        # updated_at also moves on sweeps that left the seats as they were
+        # (see touch_occupancy); changed_at only when the seats changed.
+        changed = []
+        for doc in self.db.occupancy.find({"_id": {"$in": remote_ids}}, {"updated_at": 1, "changed_at": 1}):
+            stream_id = doc["_id"]
+            stamps = (doc.get("changed_at", doc.get("updated_at")), doc.get("updated_at"))
+            mirrored = self._mirrored.get(stream_id)
+            if mirrored is None or mirrored[0] != stamps[0]:
+                changed.append(stream_id)
+            elif mirrored[1] != stamps[1]:
+                self._mirrored[stream_id] = stamps
+                if self.on_remote_sweep:
+                    self.on_remote_sweep(stream_id)
+        if changed:
+            for doc in self.db.occupancy.find({"_id": {"$in": changed}}):
+                stream_id = doc["_id"]
+                self._mirrored[stream_id] = (doc.get("changed_at", doc.get("updated_at")), doc.get("updated_at"))
+                self.on_remote_occupancy(stream_id, doc.get("seats", []))
+        for stream_id in list(self._mirrored):
+            if stream_id not in self.known_streams:
+                del self._mirrored[stream_id]
+                self.on_remote_occupancy(stream_id, None)
+
+    # Shared state
+
+    def owns(self, stream_id):
+        return stream_id in self._running
+
+    def get_stream(self, stream_id):
+        """Config of any stream in the cluster, or None if it does not exist."""
+        doc = self.known_streams.get(stream_id)
+        if doc is None:
+            doc = self.db.streams.find_one({"_id": stream_id})
+        return stream_config(doc) if doc else None
+
+    def list_streams(self):
+        with self._lock:
+            docs = list(self.known_streams.values())
+        return [stream_config(doc) for doc in docs]
+
+    def publish_occupancy(self, stream_id, seats):
+        """Write the latest sweep of a locally owned stream for the other nodes.
+
+        A sweep that finishes after remove_stream() must not re-create the
+        occupancy document, so nothing is written once the stream is gone.
+        """
+        if not self.db.streams.count_documents({"_id": stream_id}, limit=1):
+            return
+        now = time.time()
+        self.db.occupancy.update_one(
+            {"_id": stream_id},
+            {"$set": {"seats": seats, "node": self.node_id, "updated_at": now, "changed_at": now}},
+            upsert=True
+        )
+
+    def touch_occupancy(self, stream_id):
+        """Mark a sweep that left a local stream's seats unchanged, so mirrors still count it."""
+        self.db.occupancy.update_one(
+            {"_id": stream_id},
+            {"$set": {"node": self.node_id, "updated_at": time.time()}}
+        )
+
+    def remove_stream(self, stream_id):
+        """Delete a stream cluster-wide; its owner stops it on the next tick."""
+        self.db.streams.delete_one({"_id": stream_id})
+        self.db.occupancy.delete_one({"_id": stream_id})
+        with self._lock:
+            self.known_streams.pop(stream_id, None)
+
+    def status(self):
+        with self._lock:
+            live_nodes = list(self.live_nodes)
+            running = sorted(self._running)
+            known = len(self.known_streams)
+        return {
+            "node_id": self.node_id,
+            "live_nodes": live_nodes,
+            "owned_streams": running,
+            "known_streams": known,
+        }
+
+
+def stream_config(doc):
+    """Strip Mongo and lease bookkeeping from a stream document."""
+    config = {k: v for k, v in doc.items() if k != "_id" and k not in LEASE_FIELDS}
+    config.setdefault("id", doc["_id"])
+    return config
@@ -0,0 +1,305 @@
+"""
+Frame Ring Module
+
+This module handles:
+1. Keeping the last N frames of a stream, downscaled to a fixed size, in one
+   preallocated multiprocessing.shared_memory block named after the stream
+2. Writing each frame straight into its slot (no per-frame allocation)
+3. Reading slots zero-copy from this process or any other process that
+   attaches by name, e.g. for replay, debugging a misclassification or
+   re-scoring
+
+Block layout (native byte order, 8-byte aligned):
+    header      int64[8]          magic, capacity, width, height, channels, write count, owner pid
+    seq         int64[capacity]   per-slot sequence counter, odd while a write is in progress
+    timestamps  float64[capacity] epoch seconds of each slot's frame
+    sources     int64[capacity,2] native (width, height) each frame was downscaled from
+    frames      uint8[capacity,height,width,channels]
+
+A slot holding write number n has seq == 2 * (n // capacity + 1), so a reader
+can tell both a torn read and a slot that was lapped by newer frames.
+
+/dev/shm is a tmpfs that is often small (64 MB in a default Docker
+container), and writing to a page it cannot back kills the process with
+SIGBUS. create() therefore keeps SHM_HEADROOM of the tmpfs free, then
+reserves the whole block up front, raising MemoryError instead.
+
+A block is named after its stream only, so readers can attach by stream id.
+Two nodes on one host can briefly both run a stream during a lease handover;
+the block records its writer's pid, and neither create() nor close() unlinks
+a block that a live process other than this one owns.
+"""
+
+import os
+import threading
+
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+RING_PREFIX = "seatring_"
+MAGIC = 0x5345415452494E47  # "SEATRING"
+HEADER_FIELDS = 8
+_MAGIC, _CAPACITY, _WIDTH, _HEIGHT, _CHANNELS, _WRITE_COUNT, _OWNER_PID = range(7)
+READ_RETRIES = 5
+SHM_DIR = "/dev/shm"
+SHM_HEADROOM = 0.25  # fraction of SHM_DIR's total size rings never take
+
+
+def ring_name(stream_id):
+    """Shared memory name of a stream's ring."""
+    return f"{RING_PREFIX}{stream_id}"
+
+
+def slot_size(frame_shape, max_width):
+    """(width, height) of the ring slots for frames of frame_shape, never upscaled."""
+    height, width = frame_shape[:2]
+    if width <= max_width:
+        return width, height
+    return max_width, max(1, round(height * max_width / width))
+
+
+def _block_size(capacity, width, height, channels):
+    return 8 * (HEADER_FIELDS + 4 * capacity) + capacity * height * width * channels
+
+
+def shm_space():
+    """(free, total) bytes in SHM_DIR, or None where it does not exist (e.g. macOS, Windows)."""
+    try:
+        st = os.statvfs(SHM_DIR)
+    except (OSError, AttributeError):
+        return None
+    return st.f_bavail * st.f_frsize, st.f_blocks * st.f_frsize
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reserve(shm, size):
+    """Allocate the block's pages now, so running out of space fails here and not in a later write."""
+    if hasattr(os, "posix_fallocate") and hasattr(shm, "_fd"):
+        try:
+            os.posix_fallocate(shm._fd, 0, size)
+        except OSError as e:
+            shm.close()
+            shm.unlink()
+            raise MemoryError(f"cannot reserve {size} bytes for {shm.name}: {e}") from e
+
+
+def _owner_of(name):
+    """Pid of the other live process writing the block called name, or None.
+
+    Reads the header through SHM_DIR rather than attaching: on Python < 3.13
+    attaching registers the name with this process's resource tracker, which
+    would cancel the registration of a block this process created.
+    """
+    try:
+        with open(os.path.join(SHM_DIR, name), "rb") as f:
+            header = np.frombuffer(f.read(8 * HEADER_FIELDS), dtype=np.int64)
+    except OSError:
+        return None
+    if len(header) < HEADER_FIELDS or header[_MAGIC] != MAGIC:
+        return None
+    pid = int(header[_OWNER_PID])
+    if pid <= 0 or pid == os.getpid() or not _pid_alive(pid):
+        return None
+    return pid
+
+
+def _unlink(name):
+    # Attached with tracking, so unlink()'s unregister has a matching register
+    shm = shared_memory.SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached blocks too and would unlink the
+        # writer's block when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameRing:
+    """Fixed-size ring of recent frames in shared memory.
+
+    Only the creating process writes; any number of processes read.
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self._lock = threading.Lock()
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self._header[_MAGIC] != MAGIC:
+            raise ValueError(f"{shm.name} is not a frame ring")
+        self.capacity, self.width, self.height, self.channels = (
+            int(v) for v in self._header[_CAPACITY:_WRITE_COUNT]
+        )
+        n = self.capacity
+        offset = 8 * HEADER_FIELDS
+        self._seq = np.ndarray((n,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += 8 * n
+        self._timestamps = np.ndarray((n,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += 8 * n
+        self._sources = np.ndarray((n, 2), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += 16 * n
+        self._frames = np.ndarray((n, self.height, self.width, self.channels),
+                                  dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, stream_id, capacity, width, height, channels=3):
+        """Allocate a stream's ring, replacing one left behind by a crashed process.
+
+        Raises MemoryError when it would eat into SHM_HEADROOM, and
+        FileExistsError when another live process still owns the stream's ring.
+        """
+        name = ring_name(stream_id)
+        size = _block_size(capacity, width, height, channels)
+        space = shm_space()
+        if space is not None:
+            free, total = space
+            if free - size < total * SHM_HEADROOM:
+                raise MemoryError(f"{size} bytes needed for {name}, {free} of {total} free in {SHM_DIR}")
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            owner = _owner_of(name)
+            if owner is not None:
+                raise FileExistsError(f"{name} is owned by live process {owner}") from None
+            _unlink(name)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _reserve(shm, size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_MAGIC:_WRITE_COUNT] = (MAGIC, capacity, width, height, channels)
+        header[_OWNER_PID] = os.getpid()
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, stream_id):
+        """Open an existing ring read-only by stream id (raises FileNotFoundError)."""
+        return cls(_attach(ring_name(stream_id)), owner=False)
+
+    def __len__(self):
+        """Number of frames currently held."""
+        return min(self.write_count(), self.capacity)
+
+    def write_count(self):
+        return int(self._header[_WRITE_COUNT]) if self._shm is not None else 0
+
+    def push(self, frame, timestamp):
+        """Downscale frame into the next slot in place, overwriting the oldest."""
+        import cv2
+
+        with self._lock:
+            if self._shm is None or not self.owner:
+                return
+            count = int(self._header[_WRITE_COUNT])
+            i = count % self.capacity
+            slot = self._frames[i]
+            self._seq[i] += 1
+            if frame.shape == slot.shape:
+                np.copyto(slot, frame)
+            else:
+                cv2.resize(frame, (self.width, self.height), dst=slot, interpolation=cv2.INTER_AREA)
+            self._timestamps[i] = timestamp
+            self._sources[i] = (frame.shape[1], frame.shape[0])
+            self._seq[i] += 1
+            self._header[_WRITE_COUNT] = count + 1
+
+    def _locate(self, age):
+        """(slot, expected seq) of the frame `age` writes back from the newest, or None."""
+        count = self.write_count()
+        if not 0 <= age < min(count, self.capacity):
+            return None
+        n = count - 1 - age
+        return n % self.capacity, 2 * (n // self.capacity + 1)
+
+    def view(self, age=0):
+        """Zero-copy (frame, timestamp, token) for the frame `age` writes back.
+
+        The array aliases shared memory and can be overwritten by a later push;
+        check valid(token) after using it.
+        """
+        located = self._locate(age)
+        if located is None:
+            return None
+        i, expected = located
+        if self._seq[i] != expected:
+            return None
+        return self._frames[i], float(self._timestamps[i]), located
+
+    def valid(self, token):
+        """Whether the slot behind a view() still holds the same frame."""
+        i, expected = token
+        return self._shm is not None and self._seq[i] == expected
+
+    def read(self, age=0, out=None):
+        """Consistent copy (frame, timestamp, (source_width, source_height)), or None.
+
+        Pass a preallocated out array to avoid allocating per read.
+        """
+        with self._lock:
+            for _ in range(READ_RETRIES):
+                located = self._locate(age)
+                if located is None:
+                    return None
+                i, expected = located
+                if self._seq[i] != expected:
+                    continue
+                if out is None:
+                    out = np.empty_like(self._frames[i])
+                np.copyto(out, self._frames[i])
+                timestamp = float(self._timestamps[i])
+                source = (int(self._sources[i, 0]), int(self._sources[i, 1]))
+                if self._seq[i] == expected:
+                    return out, timestamp, source
+        return None
+
+    def entries(self):
+        """[(age, timestamp, (source_width, source_height))] newest first."""
+        entries = []
+        with self._lock:
+            for age in range(len(self)):
+                i, _ = self._locate(age)
+                entries.append((age, float(self._timestamps[i]),
+                                (int(self._sources[i, 0]), int(self._sources[i, 1]))))
+        return entries
+
+    def close(self):
+        """Detach; the owner also unlinks the block so the name is freed."""
+        with self._lock:
+            if self._shm is None:
+                return
+            shm, self._shm = self._shm, None
+            # Views into shm.buf must be gone before it can be closed
+            self._header = self._seq = self._timestamps = self._sources = self._frames = None
+            try:
+                shm.close()
+            except BufferError:
+                # A caller still holds a view(); the mapping goes when it does
+                pass
+            if not self.owner:
+                return
+            if _owner_of(self.name) is not None:
+                # The name was taken over; only stop the resource tracker
+                # from unlinking it when this process exits
+                resource_tracker.unregister(shm._name, "shared_memory")
+                return
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                resource_tracker.unregister(shm._name, "shared_memory")
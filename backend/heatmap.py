@@ -0,0 +1,150 @@
+"""
+Occupancy Heatmap Module
+
+This module handles:
+1. Rasterizing each sweep's occupied seats onto a coarse grid over the floorplan
+2. Accumulating those grids over time (exponential decay or a fixed window)
+3. Rendering the accumulated density as a compact grid or a PNG overlay
+
+Rasterizing uses a 2D difference array and cumulative sums, so a sweep costs
+O(seats + cells) in NumPy regardless of how large the seat boxes are.
+"""
+
+import base64
+import threading
+from collections import deque
+
+import numpy as np
+
+MODES = ("decay", "window")
+MAX_PNG_SIZE = 4096  # longest side of a rendered overlay, in pixels
+PNG_CACHE_SIZE = 8  # rendered widths kept per accumulator
+
+
+class HeatmapAccumulator:
+    """Time-averaged occupancy density of one stream's floorplan."""
+
+    def __init__(self, extent_width, extent_height, grid_width=64,
+                 mode="decay", decay=0.1, window=120):
+        if mode not in MODES:
+            raise ValueError(f"Unknown heatmap mode: {mode}")
+        self.extent_width = float(extent_width)
+        self.extent_height = float(extent_height)
+        self.grid_width = int(grid_width)
+        self.grid_height = max(1, round(grid_width * self.extent_height / self.extent_width))
+        self.cell_size = self.extent_width / self.grid_width
+        self.mode = mode
+        self.decay = decay
+        self.samples = 0  # sweeps accumulated so far, doubles as the cache version
+
+        shape = (self.grid_height, self.grid_width)
+        self._density = np.zeros(shape, dtype=np.float32)
+        self._window = deque(maxlen=window)
+        self._window_sum = np.zeros(shape, dtype=np.float32)
+        self._cache = {}  # (format, width) -> (samples, bytes)
+        self._lock = threading.Lock()
+
+    def rasterize(self, boxes, values):
+        """Paint (n, 4) floorplan boxes (x, y, width, height) with values onto the grid."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        values = np.asarray(values, dtype=np.float32).reshape(-1)
+        h, w = self.grid_height, self.grid_width
+
+        x0 = np.floor(boxes[:, 0] / self.cell_size).astype(np.int64)
+        y0 = np.floor(boxes[:, 1] / self.cell_size).astype(np.int64)
+        # Seats without a size (point coordinates) still cover their own cell
+        x1 = np.maximum(np.ceil((boxes[:, 0] + boxes[:, 2]) / self.cell_size).astype(np.int64), x0 + 1)
+        y1 = np.maximum(np.ceil((boxes[:, 1] + boxes[:, 3]) / self.cell_size).astype(np.int64), y0 + 1)
+        x0, x1 = np.clip(x0, 0, w), np.clip(x1, 0, w)
+        y0, y1 = np.clip(y0, 0, h), np.clip(y1, 0, h)
+        keep = (x1 > x0) & (y1 > y0) & (values != 0)
+        x0, x1, y0, y1, values = x0[keep], x1[keep], y0[keep], y1[keep], values[keep]
+
+        diff = np.zeros((h + 1, w + 1), dtype=np.float32)
+        np.add.at(diff, (y0, x0), values)
+        np.add.at(diff, (y0, x1), -values)
+        np.add.at(diff, (y1, x0), -values)
+        np.add.at(diff, (y1, x1), values)
+        grid = diff.cumsum(axis=0).cumsum(axis=1)[:h, :w]
+        # Overlapping seats should not push a cell past fully occupied
+        return np.clip(grid, 0.0, 1.0, out=grid)
+
+    def add(self, boxes, occupied):
+        """Accumulate one sweep; occupied is 1 for occupied seats and 0 otherwise."""
+        grid = self.rasterize(boxes, occupied)
+        with self._lock:
+            if self.mode == "decay":
+                # First sweep seeds the map instead of fading in from zero
+                alpha = 1.0 if self.samples == 0 else self.decay
+                self._density *= (1.0 - alpha)
+                self._density += alpha * grid
+            else:
+                if len(self._window) == self._window.maxlen:
+                    self._window_sum -= self._window[0]
+                self._window.append(grid)
+                self._window_sum += grid
+            self.samples += 1
+
+    def density(self):
+        """Accumulated occupancy density in [0, 1], one value per grid cell."""
+        with self._lock:
+            if self.mode == "decay":
+                return self._density.copy()
+            if not self._window:
+                return np.zeros_like(self._window_sum)
+            return np.clip(self._window_sum / len(self._window), 0.0, 1.0)
+
+    def to_grid(self):
+        """Compact JSON-ready payload: uint8 densities, row-major, base64 encoded."""
+        density = self.density()
+        return {
+            "grid_width": self.grid_width,
+            "grid_height": self.grid_height,
+            "cell_size": self.cell_size,
+            "extent_width": self.extent_width,
+            "extent_height": self.extent_height,
+            "mode": self.mode,
+            "samples": self.samples,
+            "encoding": "uint8-base64",
+            "data": base64.b64encode((density * 255).round().astype(np.uint8).tobytes()).decode('utf-8'),
+        }
+
+    def to_png(self, width=None):
+        """Colormapped RGBA overlay (transparent where empty), scaled to width if given.
+
+        width must be between 1 and MAX_PNG_SIZE; the height follows the grid's
+        aspect ratio and is capped at MAX_PNG_SIZE as well.
+        """
+        if width is not None and not 1 <= width <= MAX_PNG_SIZE:
+            raise ValueError(f"width must be between 1 and {MAX_PNG_SIZE}")
+        cached = self._cache.get(("png", width))
+        if cached is not None and cached[0] == self.samples:
+            return cached[1]
+        import cv2
+
+        samples = self.samples
+        density = (self.density() * 255).round().astype(np.uint8)
+        colored = cv2.applyColorMap(density, cv2.COLORMAP_JET)
+        overlay = np.dstack([colored, density])
+        if width:
+            height = min(MAX_PNG_SIZE, max(1, round(width * self.grid_height / self.grid_width)))
+            overlay = cv2.resize(overlay, (int(width), height), interpolation=cv2.INTER_LINEAR)
+        _, buffer = cv2.imencode('.png', overlay)
+        png = buffer.tobytes()
+        if len(self._cache) >= PNG_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[("png", width)] = (samples, png)
+        return png
+
+
+def seat_extent(boxes, margin=0.05):
+    """Floorplan size implied by (n, 4) seat boxes, for streams without floorplan dimensions.
+
+    The margin keeps seats given as bare points on the far edge inside the grid.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if not len(boxes):
+        return 1.0, 1.0
+    max_x = float((boxes[:, 0] + boxes[:, 2]).max())
+    max_y = float((boxes[:, 1] + boxes[:, 3]).max())
+    return max_x * (1 + margin) + 1, max_y * (1 + margin) + 1
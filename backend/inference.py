@@ -0,0 +1,99 @@
+"""
+Model Inference Module
+
+This module handles:
+1. Building the occupancy classifier from saved weights
+2. Warming the model up at the configured batch sizes
+3. Running batched predictions on image crops
+
+torch and torchvision are imported inside the functions so that importing
+this module (and server.py) stays cheap until a model is actually needed.
+"""
+
+import logging
+import os
+
+IMG_SIZE = 224
+# 2-class status: model output maps directly to these
+CLASS_NAMES = ["Unoccupied", "Occupied"]
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+log = logging.getLogger("inference")
+
+
+def select_device():
+    """Pick CUDA when available, CPU otherwise."""
+    import torch
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def load_classifier(model_paths, num_classes, device):
+    """Build a Classifier from the first weights file in model_paths that loads.
+
+    Returns (model, model_path), or (None, None) when no weights could be loaded.
+    """
+    import torch
+    from model import Classifier
+
+    for model_path in model_paths:
+        if not os.path.exists(model_path):
+            continue
+        try:
+            model = Classifier(num_classes=num_classes).to(device)
+            model.load_state_dict(torch.load(model_path, map_location=device))
+            model.eval()
+            return model, model_path
+        except Exception as e:
+            log.warning("Failed to load weights from %s: %s", model_path, e)
+    return None, None
+
+
+def build_preprocess(img_size=IMG_SIZE):
+    """Transform an RGB uint8 image into a normalized CHW tensor."""
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.ToTensor(),
+        transforms.Resize((img_size, img_size)),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+
+
+def batch_from_uint8(images, device=None):
+    """Normalized NCHW float tensor from (N, H, W, 3) uint8 RGB images already at model size.
+
+    Same normalization as build_preprocess, done on the device for the whole batch.
+    """
+    import torch
+
+    batch = torch.from_numpy(images).to(device).permute(0, 3, 1, 2).float().div_(255)
+    mean = torch.tensor(IMAGENET_MEAN, device=batch.device).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=batch.device).view(1, 3, 1, 1)
+    return (batch - mean) / std
+
+
+def warm_up(model, device, batch_sizes, img_size=IMG_SIZE):
+    """Run one forward pass per batch size so the first real request is not cold."""
+    import torch
+
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            dummy = torch.zeros((batch_size, 3, img_size, img_size), device=device)
+            model(dummy)
+
+
+def predict_batch(model, device, tensors):
+    """Classify preprocessed images in a single forward pass.
+
+    tensors is a list of CHW tensors or an already stacked NCHW tensor.
+    Returns (probs, predicted_idx, confidence) as CPU numpy arrays.
+    """
+    import torch
+
+    batch = tensors if torch.is_tensor(tensors) else torch.stack(tensors)
+    batch = batch.to(device)
+    with torch.no_grad():
+        probs = torch.nn.functional.softmax(model(batch), dim=1)
+        confidence, predicted_idx = torch.max(probs, 1)
+    return probs.cpu().numpy(), predicted_idx.cpu().numpy(), confidence.cpu().numpy()
@@ -0,0 +1,183 @@
+"""
+Logging Configuration Module
+
+This module handles:
+1. Structured log lines (key=value, or JSON) with extra fields per record
+2. Per-module levels from the LOG_LEVEL / LOG_LEVELS environment variables
+3. Handing records to a background thread through a queue, so stream and
+   request threads never block on stdout
+4. Rate limiting and sampling of the per-packet and per-seat loggers
+
+Environment:
+    LOG_LEVEL=INFO                          root level
+    LOG_LEVELS=capture=DEBUG,cluster=WARNING per-logger overrides
+    LOG_FORMAT=kv                           "kv" or "json"
+
+Hot paths log with %-style arguments and guard anything costly behind
+isEnabledFor(), so a disabled DEBUG line costs one level check.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_FORMAT = "kv"
+
+# Loggers with one record per packet or per seat: (records per interval, interval seconds, then keep 1 in N)
+SAMPLED_LOGGERS = {
+    "capture.packets": (20, 10.0, 1000),
+    "capture.seats": (50, 10.0, 100),
+    "server.predict": (50, 10.0, 100),
+}
+
+# LogRecord attributes that are not user supplied extra fields
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_lock = threading.Lock()
+
+
+def _extra_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+def _kv(value):
+    text = str(value)
+    if not text or any(c in text for c in ' "=\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    """ts=... level=... logger=... msg="..." plus any extra={...} fields."""
+
+    def format(self, record):
+        fields = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields.update(_extra_fields(record))
+        line = " ".join(f"{key}={_kv(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the same fields as KeyValueFormatter."""
+
+    def format(self, record):
+        fields = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields.update(_extra_fields(record))
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        return json.dumps(fields, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass `burst` records per call site every `interval` seconds, then 1 in `sample`.
+
+    A record let through after some were dropped carries suppressed=<count>.
+    """
+
+    def __init__(self, burst, interval, sample):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample = sample
+        self._windows = {}  # (pathname, lineno) -> [window start, passed, dropped]
+
+    def filter(self, record):
+        # Per call site, so one noisy line does not hide the others
+        key = (record.pathname, record.lineno)
+        now = record.created
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            dropped = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if dropped:
+                record.suppressed = dropped
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        if window[2] % self.sample == 0:
+            record.suppressed = window[2]
+            return True
+        return False
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats the message in the caller so records can be
+    pickled; the queue never leaves this process, and log arguments here are
+    plain values, so the record can go as is.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def parse_levels(spec):
+    """'capture=DEBUG,cluster=WARNING' -> {'capture': 'DEBUG', 'cluster': 'WARNING'}."""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, levels=None, fmt=None, stream=None):
+    """Install the queue handler on the root logger (once) and apply levels.
+
+    Arguments default to the LOG_LEVEL, LOG_LEVELS and LOG_FORMAT environment
+    variables. Safe to call again, e.g. to change levels.
+    """
+    global _listener
+    level = (level or os.environ.get("LOG_LEVEL") or DEFAULT_LEVEL).upper()
+    levels = levels if levels is not None else parse_levels(os.environ.get("LOG_LEVELS"))
+    fmt = fmt or os.environ.get("LOG_FORMAT") or DEFAULT_FORMAT
+
+    root = logging.getLogger()
+    with _lock:
+        if _listener is None:
+            output = logging.StreamHandler(stream or sys.stdout)
+            output.setFormatter(JsonFormatter() if fmt == "json" else KeyValueFormatter())
+            log_queue = queue.SimpleQueue()
+            root.handlers[:] = [_InProcessQueueHandler(log_queue)]
+            _listener = logging.handlers.QueueListener(log_queue, output)
+            _listener.start()
+            atexit.register(stop_logging)
+
+        for name, (burst, interval, sample) in SAMPLED_LOGGERS.items():
+            logger = logging.getLogger(name)
+            if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+                logger.addFilter(RateLimitFilter(burst, interval, sample))
+
+    root.setLevel(level)
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
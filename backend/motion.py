@@ -0,0 +1,90 @@
+"""
+Motion Gating Module
+
+This module handles:
+1. Summing codec motion vectors (H.264 side data exported by PyAV) inside
+   each seat's camera box
+2. Accumulating that motion per seat since the seat's last prediction
+3. Deciding which seats need to be re-classified on a sweep
+
+Motion is measured as pixels of displacement per pixel of box area, summed
+over the sampled frames, so one threshold works for small and large seats.
+"""
+
+import numpy as np
+
+BLOCK_SIZE = 16  # grid cell in pixels; H.264 macroblocks are 16x16
+# Stand-in box for seats without a camera mapping: they are predicted on the
+# full frame, so any motion in the frame counts for them
+FULL_FRAME_BOX = (0, 0, 1 << 30, 1 << 30)
+
+
+def motion_per_box(vectors, boxes, frame_width, frame_height, block_size=BLOCK_SIZE):
+    """Motion density of a frame inside each (x1, y1, x2, y2) box.
+
+    vectors is the structured array from PyAV's MotionVectors.to_ndarray().
+    Magnitudes are binned onto a block grid and summed per box through an
+    integral image, so the cost is O(vectors + boxes).
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    if len(vectors) == 0 or len(boxes) == 0:
+        return np.zeros(len(boxes), dtype=np.float64)
+
+    grid_w = frame_width // block_size + 1
+    grid_h = frame_height // block_size + 1
+    scale = np.maximum(vectors["motion_scale"].astype(np.float64), 1.0)
+    magnitude = np.hypot(vectors["motion_x"], vectors["motion_y"]) / scale
+    # Weight each vector by the area of the block it describes
+    magnitude *= vectors["w"].astype(np.float64) * vectors["h"]
+    gx = np.clip(vectors["dst_x"] // block_size, 0, grid_w - 1)
+    gy = np.clip(vectors["dst_y"] // block_size, 0, grid_h - 1)
+
+    integral = np.zeros((grid_h + 1, grid_w + 1), dtype=np.float64)
+    np.add.at(integral, (gy + 1, gx + 1), magnitude)
+    integral = integral.cumsum(axis=0).cumsum(axis=1)
+
+    x1 = np.clip(boxes[:, 0], 0, frame_width)
+    y1 = np.clip(boxes[:, 1], 0, frame_height)
+    x2 = np.clip(boxes[:, 2], 0, frame_width)
+    y2 = np.clip(boxes[:, 3], 0, frame_height)
+    bx1, by1 = x1 // block_size, y1 // block_size
+    bx2 = np.minimum(-(-x2 // block_size), grid_w)
+    by2 = np.minimum(-(-y2 // block_size), grid_h)
+    sums = integral[by2, bx2] - integral[by1, bx2] - integral[by2, bx1] + integral[by1, bx1]
+    area = np.maximum((x2 - x1) * (y2 - y1), 1)
+    return sums / area
+
+
+class MotionGate:
+    """Per-stream motion accumulator deciding which seats to re-classify."""
+
+    def __init__(self, threshold=0.5, sample_frames=12, max_age=300):
+        self.threshold = threshold          # accumulated motion that triggers a prediction
+        self.sample_frames = sample_frames  # inter frames read after the keyframe
+        self.max_age = max_age              # seconds before a seat is re-checked regardless
+        self._pending = np.zeros(0, dtype=np.float64)
+        self._layout = None
+
+    def boxes(self, layout):
+        """Boxes to measure motion in; unmapped seats watch the whole frame."""
+        boxes = layout.camera_boxes.copy()
+        boxes[~layout.has_camera] = FULL_FRAME_BOX
+        return boxes
+
+    def add(self, layout, motion):
+        """Accumulate one capture's motion, starting over when the layout changed."""
+        if layout is not self._layout:
+            self._layout = layout
+            self._pending = np.zeros(len(layout), dtype=np.float64)
+        self._pending += motion
+
+    def flagged(self, table, now):
+        """Boolean mask of seats to predict now; their accumulated motion is reset."""
+        mask = (
+            (self._pending >= self.threshold)
+            | (table.updated_at == 0)
+            | (table.status < 0)
+            | (now - table.updated_at >= self.max_age)
+        )
+        self._pending[mask] = 0.0
+        return mask
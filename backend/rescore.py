@@ -0,0 +1,324 @@
+"""
+Offline Re-scoring CLI
+
+Runs a checkpoint over the screenshot archive written by save_screenshot
+({stream_id}_{YYYYmmdd_HHMMSS}.jpg) for backfill or evaluation:
+1. Worker processes decode each screenshot, crop every seat using the stream's
+   stored seat mappings and resize the crops to the model's input size (uint8)
+2. The main process normalizes them and runs batched Classifier inference
+3. Results are written incrementally to Parquet part files or a Mongo collection
+4. Finished screenshots are appended to a checkpoint file, so a rerun resumes.
+   Screenshots that fail to decode are left out of it and retried next run,
+   and files modified in the last SETTLE_SECONDS are skipped, since the
+   server may still be writing them (a truncated JPEG decodes as a grey-filled
+   frame rather than failing).
+   Writes are idempotent, so a crash between a write and its checkpoint entry
+   does not duplicate rows: Mongo rows have a deterministic _id
+   (tag:screenshot:seat_id) and are upserted, and screenshots already in a
+   Parquet part file count as done.
+
+Usage:
+    python rescore.py --model models/new.pth --output rescores/
+    python rescore.py --model models/new.pth --mongo --streams ab12cd34,ef56ab78
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+
+import inference
+from capture import seat_crops
+from log_config import configure_logging
+from seat_table import SeatLayout
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SCREENSHOTS_DIR = os.path.join(BACKEND_DIR, 'screenshots')
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/myDatabase"
+RESULTS_COLLECTION = "rescores"
+SETTLE_SECONDS = 10  # screenshots younger than this may still be half written
+
+log = logging.getLogger("rescore")
+
+
+def parse_screenshot_name(name):
+    """Split '{stream_id}_{YYYYmmdd}_{HHMMSS}.jpg' into (stream_id, captured_at), or None."""
+    stem, ext = os.path.splitext(name)
+    if ext.lower() != ".jpg":
+        return None
+    parts = stem.rsplit("_", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        captured_at = datetime.strptime(f"{parts[1]}_{parts[2]}", "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+    return parts[0], captured_at
+
+
+def list_screenshots(screenshots_dir, stream_ids=None, done=(), settle_seconds=SETTLE_SECONDS):
+    """(path, name, stream_id, captured_at) for every screenshot not yet processed, oldest first per stream.
+
+    Files modified within the last settle_seconds are left for a later run.
+    """
+    jobs = []
+    cutoff = time.time() - settle_seconds
+    with os.scandir(screenshots_dir) as entries:
+        for entry in entries:
+            if entry.name in done:
+                continue
+            parsed = parse_screenshot_name(entry.name)
+            if parsed is None or (stream_ids and parsed[0] not in stream_ids):
+                continue
+            try:
+                if entry.stat().st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            jobs.append((entry.path, entry.name, parsed[0], parsed[1]))
+    jobs.sort(key=lambda job: job[1])
+    return jobs
+
+
+def load_seat_layouts(mongo_uri, stream_ids):
+    """stream_id -> coordinates (with camera_* mappings) from the streams collection."""
+    from pymongo import MongoClient
+
+    db = MongoClient(mongo_uri).get_default_database()
+    docs = db.streams.find({"_id": {"$in": list(stream_ids)}}, {"coordinates": 1})
+    return {doc["_id"]: doc.get("coordinates", []) for doc in docs}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+# Decode workers
+
+_worker_layouts = None
+
+
+def _init_worker(layouts):
+    global _worker_layouts
+    import cv2
+
+    # Spawned workers start with unconfigured logging
+    configure_logging()
+    # One process per core already; nested thread pools only add contention
+    cv2.setNumThreads(1)
+    _worker_layouts = {stream_id: SeatLayout(coords) for stream_id, coords in layouts.items()}
+
+
+def _decode_job(job):
+    """Decode one screenshot and resize each seat crop to model size. Runs in a worker process.
+
+    Crops go back as uint8 RGB (150 KB per seat at 224x224) rather than
+    normalized float32 tensors (4x that), since they cross the pool's pipe.
+    seats is None when the screenshot could not be decoded.
+    """
+    import cv2
+
+    path, name, stream_id, captured_at = job
+    size = (inference.IMG_SIZE, inference.IMG_SIZE)
+    try:
+        frame = cv2.imread(path)
+        if frame is None:
+            log.warning("Could not decode %s", name)
+            return name, stream_id, captured_at, None, None
+        layout = _worker_layouts.get(stream_id)
+        if layout is None or not len(layout):
+            return name, stream_id, captured_at, [], None
+        seats, crops = [], []
+        for i, crop, _ in seat_crops(frame, layout, range(len(layout))):
+            shrink = crop.shape[0] > size[1] or crop.shape[1] > size[0]
+            crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+            crops.append(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+            seats.append((layout.ids[i], layout.records[i]["label"]))
+        return name, stream_id, captured_at, seats, np.stack(crops) if crops else None
+    except Exception as e:
+        log.warning("Failed to decode %s: %s", name, e)
+        return name, stream_id, captured_at, None, None
+
+
+# Result sinks
+
+class ParquetSink:
+    """Writes each flush as a numbered part file in output_dir.
+
+    Each part is written under a temporary name and renamed, so a part file is
+    either complete or absent; done() lists the screenshots they hold.
+    """
+
+    def __init__(self, output_dir):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow (pip install pyarrow), or use --mongo")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.part = len([f for f in os.listdir(output_dir) if f.endswith(".parquet")])
+
+    def done(self):
+        names = set()
+        for f in os.listdir(self.output_dir):
+            if f.endswith(".parquet"):
+                table = self._pq.read_table(os.path.join(self.output_dir, f), columns=["screenshot"])
+                names.update(table.column("screenshot").to_pylist())
+        return names
+
+    def write(self, rows):
+        path = os.path.join(self.output_dir, f"part-{self.part:05d}.parquet")
+        self._pq.write_table(self._pa.Table.from_pylist(rows), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.part += 1
+
+
+class MongoSink:
+    """Upserts each flush into the rescores collection, keyed on tag:screenshot:seat_id."""
+
+    def __init__(self, mongo_uri, collection=RESULTS_COLLECTION):
+        from pymongo import MongoClient
+
+        self.collection = MongoClient(mongo_uri).get_default_database()[collection]
+
+    def done(self):
+        # Rewriting a screenshot replaces its rows, so nothing needs to be skipped
+        return set()
+
+    def write(self, rows):
+        from pymongo import ReplaceOne
+
+        self.collection.bulk_write([
+            ReplaceOne({"_id": f"{row['tag']}:{row['screenshot']}:{row['seat_id']}"}, row, upsert=True)
+            for row in rows
+        ], ordered=False)
+
+
+# Main loop
+
+def rescore(args):
+    tag = args.tag or os.path.splitext(os.path.basename(args.model))[0]
+    checkpoint_path = args.checkpoint or (
+        os.path.join(args.output, "_done.txt") if args.output
+        else os.path.join(args.screenshots, f"rescore_{tag}.done")
+    )
+    sink = ParquetSink(args.output) if args.output else MongoSink(args.mongo_uri)
+    done = load_checkpoint(checkpoint_path) | sink.done()
+    stream_ids = set(args.streams.split(",")) if args.streams else None
+
+    jobs = list_screenshots(args.screenshots, stream_ids, done)
+    layouts = load_seat_layouts(args.mongo_uri, {job[2] for job in jobs})
+    skipped = [job for job in jobs if job[2] not in layouts]
+    jobs = [job for job in jobs if job[2] in layouts]
+    print(f"{len(jobs)} screenshots to score ({len(done)} already done, "
+          f"{len(skipped)} from streams without stored seats)")
+    if not jobs:
+        return 0
+
+    device = inference.select_device()
+    model, model_path = inference.load_classifier([args.model], args.num_classes, device)
+    if model is None:
+        sys.exit(f"Could not load model weights from {args.model}")
+    inference.warm_up(model, device, [args.batch_size])
+
+    batch_crops, batch_meta = [], []
+    rows, finished = [], []
+    scored_frames = failed_frames = 0
+    start = time.time()
+
+    def run_batch():
+        if not batch_crops:
+            return
+        batch = inference.batch_from_uint8(np.stack(batch_crops), device)
+        probs, predicted_idx, confidence = inference.predict_batch(model, device, batch)
+        for meta, p, idx, conf in zip(batch_meta, probs, predicted_idx, confidence):
+            row = dict(meta)
+            row.update({
+                "status": int(idx),
+                "status_name": inference.CLASS_NAMES[idx],
+                "confidence": round(float(conf), 4),
+            })
+            for i, class_name in enumerate(inference.CLASS_NAMES):
+                row[f"prob_{class_name.lower()}"] = round(float(p[i]), 4)
+            rows.append(row)
+        batch_crops.clear()
+        batch_meta.clear()
+
+    def flush():
+        # Every frame in `finished` has all of its seats in `rows` once the batch is drained
+        run_batch()
+        if rows:
+            sink.write(rows)
+        with open(checkpoint_path, "a") as f:
+            f.writelines(f"{name}\n" for name in finished)
+        elapsed = time.time() - start
+        print(f"{scored_frames}/{len(jobs)} screenshots, {scored_frames / elapsed * 3600:.0f} frames/hour")
+        rows.clear()
+        finished.clear()
+
+    # spawn, not fork: forking after torch has started its thread pools can deadlock the workers
+    with get_context("spawn").Pool(args.workers, initializer=_init_worker, initargs=(layouts,)) as pool:
+        for name, stream_id, captured_at, seats, crops in pool.imap(_decode_job, jobs, chunksize=4):
+            if seats is None:
+                # Not checkpointed, so the next run retries it
+                failed_frames += 1
+                continue
+            for i, (seat_id, label) in enumerate(seats):
+                batch_crops.append(crops[i])
+                batch_meta.append({
+                    "screenshot": name,
+                    "stream_id": stream_id,
+                    "captured_at": captured_at.isoformat(),
+                    "seat_id": seat_id,
+                    "label": label,
+                    "model": model_path,
+                    "tag": tag,
+                })
+            finished.append(name)
+            scored_frames += 1
+            if len(batch_crops) >= args.batch_size:
+                run_batch()
+            if len(finished) >= args.flush_every:
+                flush()
+    flush()
+    if failed_frames:
+        print(f"{failed_frames} screenshots failed to decode and will be retried on the next run")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score archived screenshots with a model checkpoint.")
+    parser.add_argument("--model", required=True, help="Path to the .pth weights to evaluate")
+    parser.add_argument("--screenshots", default=SCREENSHOTS_DIR, help="Screenshot archive directory")
+    parser.add_argument("--streams", help="Comma-separated stream ids to include (default: all)")
+    parser.add_argument("--output", help="Directory for Parquet part files (needs pyarrow)")
+    parser.add_argument("--mongo", action="store_true", help=f"Write to the '{RESULTS_COLLECTION}' collection instead")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", DEFAULT_MONGO_URI))
+    parser.add_argument("--tag", help="Label stored with every result (default: model file name)")
+    parser.add_argument("--checkpoint", help="File listing finished screenshots, used to resume")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Decode worker processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="Seat crops per forward pass")
+    parser.add_argument("--flush-every", type=int, default=500, help="Screenshots per output write")
+    parser.add_argument("--num-classes", type=int, default=len(inference.CLASS_NAMES))
+    args = parser.parse_args(argv)
+
+    if bool(args.output) == bool(args.mongo):
+        parser.error("choose exactly one of --output or --mongo")
+    configure_logging()
+    return rescore(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
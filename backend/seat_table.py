@@ -0,0 +1,150 @@
+"""
+Seat Table Module
+
+This module handles:
+1. Keeping a stream's static seat layout (ids, labels, floorplan and camera
+   boxes) once, in NumPy arrays and prebuilt records
+2. Updating per-seat dynamic state (status, confidence, last update) in place
+   in typed arrays
+3. Converting to the per-seat JSON shape only at the API boundary
+
+A sweep therefore writes a few numbers per seat instead of building a fresh
+dict, and a published snapshot only copies the three dynamic arrays.
+"""
+
+import numpy as np
+
+from inference import CLASS_NAMES
+
+CAMERA_KEYS = ("camera_x", "camera_y", "camera_width", "camera_height")
+
+
+class SeatLayout:
+    """Static part of a seat table; shared by every copy of it."""
+
+    __slots__ = ("ids", "records", "index", "floor_boxes", "camera_boxes", "has_camera")
+
+    def __init__(self, coordinates):
+        self.ids = [coord.get("id", "unknown") for coord in coordinates]
+        self.index = {seat_id: i for i, seat_id in enumerate(self.ids)}
+        self.records = [
+            {
+                "id": coord.get("id", "unknown"),
+                # Floorplan coordinates
+                "x": coord.get("x", 0),
+                "y": coord.get("y", 0),
+                "width": coord.get("width", 0),
+                "height": coord.get("height", 0),
+                # Camera coordinates
+                "camera_x": coord.get("camera_x"),
+                "camera_y": coord.get("camera_y"),
+                "camera_width": coord.get("camera_width"),
+                "camera_height": coord.get("camera_height"),
+                # Seat info
+                "label": coord.get("label", "Unknown"),
+            }
+            for coord in coordinates
+        ]
+
+        n = len(coordinates)
+        self.floor_boxes = np.zeros((n, 4), dtype=np.float32)  # x, y, width, height
+        self.camera_boxes = np.zeros((n, 4), dtype=np.int64)   # x1, y1, x2, y2 (unclipped)
+        self.has_camera = np.zeros(n, dtype=bool)
+        for i, record in enumerate(self.records):
+            self.floor_boxes[i] = [record["x"] or 0, record["y"] or 0,
+                                   record["width"] or 0, record["height"] or 0]
+            camera = [record[key] for key in CAMERA_KEYS]
+            if all(v is not None for v in camera) and camera[2] > 0 and camera[3] > 0:
+                cx, cy, cw, ch = camera
+                self.camera_boxes[i] = [int(cx), int(cy), int(cx + cw), int(cy + ch)]
+                self.has_camera[i] = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def clipped_camera_boxes(self, frame_width, frame_height):
+        """Camera boxes clipped to the frame, for all seats at once."""
+        boxes = self.camera_boxes.copy()
+        boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, frame_width)
+        boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, frame_height)
+        return boxes
+
+
+class SeatTable:
+    """Seat layout plus dynamic per-seat state in typed arrays."""
+
+    __slots__ = ("layout", "status", "confidence", "updated_at", "class_names")
+
+    def __init__(self, layout, class_names=CLASS_NAMES, previous=None):
+        if not isinstance(layout, SeatLayout):
+            layout = SeatLayout(layout)
+        n = len(layout)
+        self.layout = layout
+        self.class_names = class_names
+        self.status = np.full(n, -1, dtype=np.int8)  # -1 until predicted, or on error
+        self.confidence = np.zeros(n, dtype=np.float64)
+        self.updated_at = np.zeros(n, dtype=np.float64)  # epoch seconds, 0 = never
+        if previous is not None:
+            self._carry_over(previous)
+
+    @classmethod
+    def from_seats(cls, seats, class_names=CLASS_NAMES):
+        """Build a table from per-seat dicts (a restored or mirrored sweep)."""
+        table = cls(SeatLayout(seats), class_names)
+        for i, seat in enumerate(seats):
+            status = seat.get("status")
+            table.status[i] = status if isinstance(status, int) else -1
+            table.confidence[i] = seat.get("confidence") or 0
+            table.updated_at[i] = seat.get("updated_at") or 0
+        return table
+
+    def __len__(self):
+        return len(self.layout)
+
+    def _carry_over(self, previous):
+        """Keep the state of seats that survive a layout change.
+
+        A seat whose camera box moved starts over (-1, never updated), so the
+        next sweep predicts it from its new crop instead of keeping the old one.
+        """
+        layout, old = self.layout, previous.layout
+        for i, seat_id in enumerate(layout.ids):
+            j = old.index.get(seat_id)
+            if (j is not None and layout.has_camera[i] == old.has_camera[j]
+                    and np.array_equal(layout.camera_boxes[i], old.camera_boxes[j])):
+                self.status[i] = previous.status[j]
+                self.confidence[i] = previous.confidence[j]
+                self.updated_at[i] = previous.updated_at[j]
+
+    def update(self, i, prediction, timestamp):
+        """Record a predict_occupancy result for seat i in place."""
+        self.status[i] = prediction["class_index"]
+        self.confidence[i] = prediction["confidence"]
+        self.updated_at[i] = timestamp
+
+    def copy(self):
+        """Snapshot of the dynamic state; the layout is shared, not copied."""
+        table = SeatTable.__new__(SeatTable)
+        table.layout = self.layout
+        table.class_names = self.class_names
+        table.status = self.status.copy()
+        table.confidence = self.confidence.copy()
+        table.updated_at = self.updated_at.copy()
+        return table
+
+    def status_name(self, status):
+        return self.class_names[status] if 0 <= status < len(self.class_names) else "Error"
+
+    def to_dicts(self):
+        """Per-seat dicts in the API's JSON shape."""
+        seats = []
+        for record, status, confidence, updated_at in zip(
+                self.layout.records, self.status.tolist(),
+                self.confidence.tolist(), self.updated_at.tolist()):
+            seat = dict(record)
+            seat["status"] = status
+            seat["status_name"] = self.status_name(status)
+            seat["confidence"] = round(confidence, 4)
+            seat["updated_at"] = updated_at
+            seats.append(seat)
+        return seats
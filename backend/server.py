@@ -1,24 +1,34 @@
+import time
+_PROCESS_START = time.perf_counter()
+
 from flask_pymongo import PyMongo
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
 import sys
 import threading
-import time
-import cv2
 import base64
-import numpy as np
 from datetime import datetime
-from collections import defaultdict
 import uuid
-import torch
-import numpy as np
-from torchvision.transforms import ToTensor, Resize, Compose
-from model import Classifier  
-from pathlib import Path
-from torchvision import transforms
-# Import capture module
-from capture import capture_frame_from_stream, save_screenshot, process_stream
+import socket
+import atexit
+import logging
+from log_config import configure_logging
+# Import capture module (cv2 and PyAV are imported lazily inside it)
+from capture import save_screenshot, process_stream
+from capture_service import CaptureService, CaptureTimeout, CaptureUnavailable
+import inference
+from cluster import ClusterCoordinator, stream_config
+from snapshots import SnapshotStore, SnapshotWriter
+from thumbnails import FramePyramid
+from heatmap import HeatmapAccumulator, seat_extent, MAX_PNG_SIZE
+from motion import MotionGate
+from frame_ring import FrameRing, slot_size
+
+# Structured, queued logging; levels from LOG_LEVEL / LOG_LEVELS
+configure_logging()
+log = logging.getLogger("server")
+predict_log = logging.getLogger("server.predict")  # one record per prediction, rate limited
 
 # Add od-model to path for importing the model
 OD_MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../od-model'))
@@ -27,21 +37,69 @@ sys.path.insert(0, OD_MODEL_PATH)
 app = Flask(__name__)
 # Only allow your specific React dev server to talk to the backend
 CORS(app, resources={r"/*": {"origins": "*"}})
-app.config["MONGO_URI"] = "mongodb://localhost:27017/myDatabase"
+app.config["MONGO_URI"] = os.environ.get("MONGO_URI", "mongodb://localhost:27017/myDatabase")
+# PyMongo connects lazily; check_mongo() pings it during startup
+MONGO_PING_TIMEOUT_MS = 2000
 try:
     mongo = PyMongo(app)
     MONGO_AVAILABLE = True
 except Exception as e:
-    print(f"MongoDB not available: {e}. Running without database.")
+    log.warning("MongoDB not available: %s. Running without database.", e)
     mongo = None
     MONGO_AVAILABLE = False
 
 # Configuration
 SCREENSHOT_INTERVAL = 30  # seconds between screenshots
+# Age up to which a worker's frame is served instead of a live capture; a sweep
+# can finish late by its own capture and inference time
+FRAME_MAX_AGE = 2 * SCREENSHOT_INTERVAL
 NUM_CLASSES = 2  # model has 2 output neurons
 IMG_SIZE = 224
-# 2-class status: model output maps directly to these
-CLASS_NAMES = ["Unoccupied", "Occupied"]
+# Forward passes run before the server reports ready; only the batch sizes
+# that actually run (predict_occupancy classifies one seat at a time)
+WARMUP_BATCH_SIZES = [1]
+CLASS_NAMES = inference.CLASS_NAMES
+
+# Cluster mode: several server processes share the streams in MongoDB
+SERVER_PORT = int(os.environ.get("PORT", 5001))
+CLUSTER_MODE = os.environ.get("CLUSTER_MODE", "0") == "1"
+NODE_ID = os.environ.get("NODE_ID") or f"{socket.gethostname()}-{SERVER_PORT}"
+CLUSTER_HEARTBEAT_INTERVAL = 5  # seconds between heartbeats / rebalances
+CLUSTER_LEASE_TTL = 15  # seconds a stream lease stays valid without renewal
+
+# Warm restart: streams persisted in MongoDB are resumed on boot in waves
+BOOTSTRAP_CONCURRENCY = 4  # streams started per wave (per heartbeat in cluster mode)
+BOOTSTRAP_WAVE_DELAY = 2  # seconds between waves
+
+# Sweeps are persisted for warm restarts at most this often per stream; building
+# the per-seat documents is the costly part. Other cluster nodes mirror the
+# persisted sweeps, so there every sweep is written.
+OCCUPANCY_PERSIST_INTERVAL = 0 if CLUSTER_MODE else 120  # seconds
+
+# Server-side heatmaps accumulated from every sweep
+HEATMAP_GRID_WIDTH = 64  # cells across the floorplan
+HEATMAP_MODE = "decay"  # "decay" (exponential) or "window" (last HEATMAP_WINDOW sweeps)
+HEATMAP_DECAY = 0.1  # weight of the newest sweep in decay mode
+HEATMAP_WINDOW = 120  # sweeps averaged in window mode
+
+# Motion gating: only re-classify seats whose camera box moved (H.264 motion vectors)
+MOTION_GATING = os.environ.get("MOTION_GATING", "0") == "1"
+MOTION_THRESHOLD = 0.5  # accumulated pixels of motion per pixel of seat area
+MOTION_SAMPLE_FRAMES = 12  # inter frames read after the keyframe on each sweep
+MOTION_MAX_AGE = 300  # seconds before an idle seat is re-classified anyway
+MOTION_IDLE_FRAME_INTERVAL = 120  # seconds between stored frames (thumbnails, ring) while nothing moves
+
+# Request-triggered captures (/frame, /capture, /latest) run on a bounded pool
+CAPTURE_DEADLINE = 8  # seconds a handler waits for a frame before answering 504
+CAPTURE_MAX_WORKERS = 4  # concurrent request-triggered RTSP connections
+CAPTURE_MAX_PENDING = 16  # queued + running captures before answering 503
+CAPTURE_OPEN_TIMEOUT = 5  # seconds for PyAV to open a source
+CAPTURE_READ_TIMEOUT = 5  # seconds PyAV waits for data once open
+CAPTURE_MAX_SECONDS = 15  # seconds of reading packets before giving up on a keyframe
+
+# Recent frames kept per stream in shared memory (see frame_ring.py)
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", 16))  # frames per stream, 0 disables
+FRAME_RING_WIDTH = 640  # slot width; frames are downscaled to it, never upscaled
 
 # Model paths - will check in order
 BACKEND_DIR = os.path.dirname(__file__)
@@ -62,7 +120,19 @@ os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
 # Global State   
 active_streams = {}  # stream_id -> stream_info
 stream_threads = {}  # stream_id -> thread
-occupancy_data = defaultdict(dict)  # stream_id -> {seat_id: occupancy_info}
+occupancy_store = SnapshotStore(dumps=app.json.dumps)  # stream_id -> latest versioned snapshot
+cluster = None  # ClusterCoordinator when CLUSTER_MODE is on
+frame_pyramids = {}  # stream_id -> FramePyramid of the latest captured frame
+heatmaps = {}  # stream_id -> HeatmapAccumulator
+# Persists sweeps to MongoDB off the stream threads
+occupancy_writer = SnapshotWriter(lambda stream_id, snapshot: persist_occupancy(stream_id, snapshot),
+                                  min_interval=OCCUPANCY_PERSIST_INTERVAL,
+                                  touch=lambda stream_id, snapshot: touch_occupancy(stream_id))
+atexit.register(occupancy_writer.stop)
+frame_rings = {}  # stream_id -> FrameRing of the worker's recent frames
+frame_rings_disabled = set()  # streams whose ring did not fit in shared memory
+capture_service = CaptureService(CAPTURE_MAX_WORKERS, CAPTURE_MAX_PENDING,
+                                 CAPTURE_OPEN_TIMEOUT, CAPTURE_READ_TIMEOUT, CAPTURE_MAX_SECONDS)
 
 # Dummy coordinates for seats/tables
 DUMMY_COORDINATES = [
@@ -78,54 +148,356 @@ DUMMY_COORDINATES = [
 model = None
 device = None
 model_loaded_path = None
+preprocess = None
+
+# Startup sequence: phase name -> seconds, filled in by create_app()
+startup_lock = threading.Lock()
+startup_report = {
+    "ready": False,
+    "phases": {},
+    "time_to_ready_seconds": None,
+    "bootstrap": {"streams": 0, "started": 0, "restored_occupancy": 0},
+}
+
+def _run_startup_phase(name, fn):
+    """Run one startup phase and record how long it took."""
+    start = time.perf_counter()
+    try:
+        return fn()
+    finally:
+        startup_report["phases"][name] = round(time.perf_counter() - start, 4)
+
+def _import_heavy_modules():
+    """Import torch and torchvision, which the model load needs next, as their own timed phase.
+    
+    cv2 and PyAV stay deferred until the first frame is captured or encoded.
+    """
+    import torch
+    import torchvision
 
 def load_model():
     """Load the occupancy detection model."""
-    global model, device, model_loaded_path
+    global model, device, model_loaded_path, preprocess
     
     try:
-        import torch
-        from model import Classifier
-        
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"🔧 PyTorch available, using device: {device}")
-        # Search for model weights
-        for model_path in MODEL_PATHS:
-            if os.path.exists(model_path):
-                try:
-                    temp_model = Classifier(num_classes=2).to(device)
-                    temp_model.load_state_dict(torch.load(model_path, map_location=device))
-                    model = temp_model
-                    model_loaded_path = model_path
-                    model.eval()
-                    
-                    print(f"Model loaded from: {model_path}")
-                    return True
-                except Exception as e:
-                    print(f"Failed to load weights from {model_path}: {e}")
-                    continue
-        
+        device = inference.select_device()
+        log.info("PyTorch available, using device: %s", device)
+        model, model_loaded_path = inference.load_classifier(MODEL_PATHS, NUM_CLASSES, device)
+        if model is not None:
+            preprocess = inference.build_preprocess(IMG_SIZE)
+            log.info("Model loaded from: %s", model_loaded_path)
+            return True
         
-        print(f"No model weights found")
-        print(f"Place model file (.pth) in: {MODELS_DIR}")
-        model = None
+        log.warning("No model weights found")
+        log.warning("Place model file (.pth) in: %s", MODELS_DIR)
         return False
         
     except ImportError:
-        print(f"PyTorch not available - cannot run predictions")
+        log.warning("PyTorch not available - cannot run predictions")
         model = None
         device = None
         return False
-    except Exception as e:
-        print(f"Error during model setup: {e}")
+    except Exception:
+        log.exception("Error during model setup")
         model = None
         return False
 
+def warm_up_model():
+    """Run warm-up forward passes at each configured batch size."""
+    if model is None:
+        return False
+    try:
+        inference.warm_up(model, device, WARMUP_BATCH_SIZES, IMG_SIZE)
+        log.info("Model warmed up at batch sizes: %s", WARMUP_BATCH_SIZES)
+        return True
+    except Exception:
+        log.exception("Model warm-up failed")
+        return False
+
+def check_mongo():
+    """Ping MongoDB once with a short timeout; without it, run as if no database was configured.
+    
+    Otherwise every MongoDB call (bootstrap, per-request writes) would wait
+    out the driver's 30 s server selection timeout.
+    """
+    global MONGO_AVAILABLE
+    if not mongo:
+        return False
+    from pymongo import MongoClient
+    
+    client = MongoClient(app.config["MONGO_URI"], serverSelectionTimeoutMS=MONGO_PING_TIMEOUT_MS)
+    try:
+        client.admin.command("ping")
+        return True
+    except Exception as e:
+        log.warning("MongoDB not reachable: %s. Running without database.", e)
+        MONGO_AVAILABLE = False
+        return False
+    finally:
+        client.close()
+
+def create_app():
+    """Run the startup sequence once and return the Flask app.
+
+    Phases: heavy imports, model load, warm-up. The per-phase timings and the
+    total time since process start are exposed on the health endpoint.
+    """
+    with startup_lock:
+        if startup_report["ready"]:
+            return app
+        startup_report["phases"]["module_import"] = round(time.perf_counter() - _PROCESS_START, 4)
+        _run_startup_phase("mongo_check", check_mongo)
+        try:
+            _run_startup_phase("heavy_imports", _import_heavy_modules)
+        except ImportError as e:
+            log.warning("Heavy import failed: %s", e)
+        _run_startup_phase("model_load", load_model)
+        _run_startup_phase("warmup", warm_up_model)
+        _run_startup_phase("bootstrap_load", bootstrap_streams)
+        if CLUSTER_MODE:
+            _run_startup_phase("cluster_join", start_cluster)
+        startup_report["time_to_ready_seconds"] = round(time.perf_counter() - _PROCESS_START, 4)
+        startup_report["ready"] = True
+        log.info("Server ready", extra={"time_to_ready_seconds": startup_report["time_to_ready_seconds"], **startup_report["phases"]})
+    return app
+
+
+# Stream workers
+
+def start_stream_worker(stream_info):
+    """Register a stream and start its background processing thread."""
+    stream_id = stream_info["id"]
+    coordinates = stream_info.setdefault("coordinates", DUMMY_COORDINATES)
+    active_streams[stream_id] = stream_info
+    thread = threading.Thread(
+        target=process_stream,
+        args=(stream_id, stream_info["url"], active_streams, occupancy_store,
+              coordinates, SCREENSHOTS_DIR, SCREENSHOT_INTERVAL,
+              predict_occupancy, mongo, MONGO_AVAILABLE),
+        kwargs={
+            "publish_fn": publish_occupancy,
+            "frame_fn": store_frame,
+            "motion_gate": MotionGate(MOTION_THRESHOLD, MOTION_SAMPLE_FRAMES, MOTION_MAX_AGE)
+                           if MOTION_GATING else None,
+            "capture_timeout": (CAPTURE_OPEN_TIMEOUT, CAPTURE_READ_TIMEOUT),
+            "capture_max_seconds": CAPTURE_MAX_SECONDS,
+            "idle_frame_interval": MOTION_IDLE_FRAME_INTERVAL,
+        },
+        daemon=True
+    )
+    thread.start()
+    stream_threads[stream_id] = thread
+
+def stop_stream_worker(stream_id):
+    """Signal a stream's thread to stop and drop its local state."""
+    stream_info = active_streams.pop(stream_id, None)
+    if stream_info:
+        stream_info["active"] = False
+    stream_threads.pop(stream_id, None)
+    occupancy_store.remove(stream_id)
+    frame_pyramids.pop(stream_id, None)
+    heatmaps.pop(stream_id, None)
+    occupancy_writer.discard(stream_id)
+    frame_rings_disabled.discard(stream_id)
+    ring = frame_rings.pop(stream_id, None)
+    if ring:
+        ring.close()
+
+def publish_occupancy(stream_id, snapshot):
+    """Called after each sweep; queues the latest result for warm restarts and other cluster nodes."""
+    update_heatmap(stream_id, snapshot.table)
+    if MONGO_AVAILABLE and mongo:
+        occupancy_writer.submit(snapshot)
+
+def persist_occupancy(stream_id, snapshot):
+    """Write a snapshot to MongoDB; runs on the occupancy_writer thread, not the sweep."""
+    seats = list(snapshot.seats)
+    if cluster:
+        cluster.publish_occupancy(stream_id, seats)
+    elif stream_id in active_streams:
+        # A removed stream's document is gone; do not re-create it
+        mongo.db.occupancy.update_one(
+            {"_id": stream_id},
+            {"$set": {"seats": seats, "updated_at": time.time()}},
+            upsert=True
+        )
+
+def touch_occupancy(stream_id):
+    """Record an unchanged sweep; only cluster mirrors need it, for their heatmaps."""
+    if cluster:
+        cluster.touch_occupancy(stream_id)
+
+def update_heatmap(stream_id, table):
+    """Fold one sweep (a SeatTable) into the stream's heatmap, starting over if the floorplan changed."""
+    if not len(table):
+        return
+    try:
+        boxes = table.layout.floor_boxes
+        stream_info = get_stream_info(stream_id) or {}
+        extent = (stream_info.get("floorplan_width"), stream_info.get("floorplan_height"))
+        if not all(extent):
+            extent = seat_extent(boxes)
+        accumulator = heatmaps.get(stream_id)
+        if accumulator is None or (accumulator.extent_width, accumulator.extent_height) != extent:
+            accumulator = HeatmapAccumulator(
+                extent[0], extent[1], grid_width=HEATMAP_GRID_WIDTH,
+                mode=HEATMAP_MODE, decay=HEATMAP_DECAY, window=HEATMAP_WINDOW
+            )
+            heatmaps[stream_id] = accumulator
+        accumulator.add(boxes, table.status == 1)
+    except Exception as e:
+        log.warning("Failed to update heatmap: %s", e, extra={"stream_id": stream_id})
+
+def store_frame(stream_id, frame):
+    """Called with each captured frame; encodes its thumbnails once, off the request path.
+    
+    frame is None on a motion-gated sweep that saw no motion: the last frame
+    is still what the camera shows, so it is only marked fresh again.
+    """
+    if frame is None:
+        pyramid = frame_pyramids.get(stream_id)
+        if pyramid is not None:
+            pyramid.timestamp = time.time()
+        return
+    try:
+        pyramid = FramePyramid(frame).prebuild()
+        frame_pyramids[stream_id] = pyramid
+    except Exception as e:
+        log.warning("Failed to build thumbnails: %s", e, extra={"stream_id": stream_id})
+        return
+    if FRAME_RING_SLOTS:
+        push_recent_frame(stream_id, frame, pyramid.timestamp)
+
+def push_recent_frame(stream_id, frame, timestamp):
+    """Copy a frame into the stream's shared-memory ring, creating it on first use."""
+    try:
+        ring = frame_rings.get(stream_id)
+        if ring is None:
+            if stream_id not in active_streams or stream_id in frame_rings_disabled:
+                return
+            width, height = slot_size(frame.shape, FRAME_RING_WIDTH)
+            try:
+                ring = FrameRing.create(stream_id, FRAME_RING_SLOTS, width, height, frame.shape[2])
+            except MemoryError as e:
+                frame_rings_disabled.add(stream_id)
+                log.warning("Not enough shared memory, recent frames disabled: %s", e,
+                            extra={"stream_id": stream_id})
+                return
+            except FileExistsError as e:
+                # The previous owner of a handed-over stream has not closed its ring yet
+                log.debug("Frame ring still in use, retrying next sweep: %s", e,
+                          extra={"stream_id": stream_id})
+                return
+            frame_rings[stream_id] = ring
+            log.info("Frame ring created", extra={"stream_id": stream_id, "shm_name": ring.name, "slots": FRAME_RING_SLOTS, "width": width, "height": height})
+        ring.push(frame, timestamp)
+    except Exception as e:
+        log.warning("Failed to store recent frame: %s", e, extra={"stream_id": stream_id})
+
+def close_frame_rings():
+    for stream_id in list(frame_rings):
+        frame_rings.pop(stream_id).close()
+
+atexit.register(close_frame_rings)
+
+def get_stream_info(stream_id):
+    """Config of a stream processed here or, in cluster mode, on any node."""
+    if stream_id in active_streams:
+        return active_streams[stream_id]
+    if cluster:
+        return cluster.get_stream(stream_id)
+    return None
+
+def _update_cluster_stream(stream_info):
+    local = active_streams.get(stream_info["id"])
+    if local is not None:
+        coordinates = stream_info.get("coordinates", local.get("coordinates"))
+        if coordinates != local.get("coordinates"):
+            # A new list makes the stream thread rebuild its seat table
+            local["coordinates"] = coordinates
+        local["seat_mappings"] = stream_info.get("seat_mappings", {})
+
+def _mirror_remote_occupancy(stream_id, seats):
+    if seats is None:
+        occupancy_store.remove(stream_id)
+        heatmaps.pop(stream_id, None)
+    else:
+        snapshot = occupancy_store.publish(stream_id, seats)
+        update_heatmap(stream_id, snapshot.table)
+
+def _mirror_remote_sweep(stream_id):
+    # The owner's idle sweep counts toward its heatmap, so it counts here too
+    snapshot = occupancy_store.get(stream_id)
+    if snapshot is not None:
+        update_heatmap(stream_id, snapshot.table)
+
+def bootstrap_streams():
+    """Resume the streams persisted in MongoDB and restore their last occupancy.
+    
+    Stream configs (with coordinates and seat_mappings) and the last persisted
+    sweep are bulk-loaded here; workers are then started in the background in
+    waves of BOOTSTRAP_CONCURRENCY so the RTSP connections do not all open at
+    once. In cluster mode only the occupancy is restored and the coordinator
+    claims the streams.
+    """
+    if not (MONGO_AVAILABLE and mongo):
+        return False
+    try:
+        docs = list(mongo.db.streams.find({"url": {"$exists": True}, "active": {"$ne": False}}))
+        stream_ids = [doc["_id"] for doc in docs]
+        occupancy_docs = list(mongo.db.occupancy.find({"_id": {"$in": stream_ids}}))
+    except Exception as e:
+        log.error("Failed to load streams from MongoDB: %s", e)
+        return False
+    
+    for doc in occupancy_docs:
+        occupancy_store.publish(doc["_id"], doc.get("seats", []))
+    startup_report["bootstrap"]["restored_occupancy"] = len(occupancy_docs)
+    
+    if CLUSTER_MODE:
+        return True
+    
+    configs = [stream_config(doc) for doc in docs]
+    startup_report["bootstrap"]["streams"] = len(configs)
+    log.info("Resuming streams from MongoDB", extra={"streams": len(configs), "with_occupancy": len(occupancy_docs)})
+    
+    def start_waves():
+        for i in range(0, len(configs), BOOTSTRAP_CONCURRENCY):
+            for config in configs[i:i + BOOTSTRAP_CONCURRENCY]:
+                if config["id"] not in active_streams:
+                    config["active"] = True
+                    start_stream_worker(config)
+                startup_report["bootstrap"]["started"] += 1
+            time.sleep(BOOTSTRAP_WAVE_DELAY)
+    
+    threading.Thread(target=start_waves, daemon=True).start()
+    return True
+
+def start_cluster():
+    """Join the cluster; streams are then claimed from MongoDB instead of started per request."""
+    global cluster
+    if not (MONGO_AVAILABLE and mongo):
+        log.warning("Cluster mode requires MongoDB; running standalone")
+        return False
+    cluster = ClusterCoordinator(
+        mongo.db, NODE_ID,
+        start_stream=start_stream_worker,
+        stop_stream=stop_stream_worker,
+        update_stream=_update_cluster_stream,
+        on_remote_occupancy=_mirror_remote_occupancy,
+        on_remote_sweep=_mirror_remote_sweep,
+        node_url=f"http://{socket.gethostname()}:{SERVER_PORT}",
+        heartbeat_interval=CLUSTER_HEARTBEAT_INTERVAL,
+        lease_ttl=CLUSTER_LEASE_TTL,
+        max_claims_per_tick=BOOTSTRAP_CONCURRENCY,
+    )
+    cluster.start()
+    atexit.register(cluster.stop)
+    return True
+
 
 def predict_occupancy(image):
     """Run occupancy prediction on an image."""
-    global model, device
-    
     if model is None:
         # No model loaded - return error instead of mock
         return {
@@ -137,37 +509,22 @@ def predict_occupancy(image):
         }
     
     try:
-        import torch
-        from torchvision import transforms
-        from torchvision.transforms import ToTensor, Resize, Compose
-        
-        preprocess = Compose([
-            ToTensor(),
-            Resize((IMG_SIZE, IMG_SIZE)),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
+        import cv2
         
         img_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-        img_tensor = preprocess(img_rgb).unsqueeze(0).to(device)
-        
-        with torch.no_grad():
-            outputs = model(img_tensor)
-            
-            probs = torch.nn.functional.softmax(outputs, dim=1)
-            
-            confidence, predicted_idx = torch.max(probs, 1)
-        
-        class_idx = predicted_idx.item()
-        conf = confidence.item()
-        
-        # Log ALL class probabilities for debugging
-        all_probs = probs[0].cpu().numpy()
-        prob_str = " | ".join(
-            f"{CLASS_NAMES[i]}: {all_probs[i]*100:.1f}%"
-            for i in range(len(CLASS_NAMES))
+        all_probs, predicted_idx, confidence = inference.predict_batch(
+            model, device, [preprocess(img_rgb)]
         )
-        print(f"  📊 Model probabilities: {prob_str}")
+        all_probs = all_probs[0]
+        class_idx = int(predicted_idx[0])
+        conf = float(confidence[0])
+        
+        # Log ALL class probabilities for debugging (built only when enabled)
+        if predict_log.isEnabledFor(logging.DEBUG):
+            predict_log.debug("Model probabilities", extra={
+                f"p_{CLASS_NAMES[i].lower()}": round(float(all_probs[i]), 4)
+                for i in range(len(CLASS_NAMES))
+            })
         
         return {
             "class_index": class_idx,
@@ -182,7 +539,7 @@ def predict_occupancy(image):
         }
         
     except Exception as e:
-        print(f"Error during prediction: {e}")
+        predict_log.exception("Error during prediction")
         return {
             "class_index": -1,
             "class_name": "Error",
@@ -204,8 +561,12 @@ def health_check():
         "device": str(device) if device else "N/A",
         "active_streams": len(active_streams),
         "mongodb_available": MONGO_AVAILABLE,
+        "cluster": cluster.status() if cluster else None,
         "screenshot_interval_seconds": SCREENSHOT_INTERVAL,
-        "models_directory": MODELS_DIR
+        "motion_gating": MOTION_GATING,
+        "captures_in_flight": capture_service.in_flight(),
+        "models_directory": MODELS_DIR,
+        "startup": startup_report
     })
 
 @app.route("/upload-floorplan", methods=["POST"])
@@ -246,10 +607,10 @@ def upload_floorplan():
             }
             
             mongo.db.floorplans.insert_one(floorplan_doc)
-            print(f"Floorplan {floorplan_id} stored in MongoDB")
+            log.info("Floorplan stored in MongoDB", extra={"floorplan_id": floorplan_id})
             
         except Exception as e:
-            print(f"Failed to store floorplan in MongoDB: {e}")
+            log.warning("Failed to store floorplan in MongoDB: %s", e)
     
     return jsonify({
         "message": "Floorplan received and saved",
@@ -300,12 +661,13 @@ def submit_floorplan():
         "active": True,
         "created_at": datetime.now().isoformat(),
         "floorplan_id": floorplan_id,
+        "floorplan_width": image_width,
+        "floorplan_height": image_height,
         "coordinates": seats
     }
     
-    active_streams[stream_id] = stream_info
-    
     # Store in MongoDB if available
+    stored = False
     if MONGO_AVAILABLE and mongo:
         try:
             with open(filepath, 'rb') as f:
@@ -338,22 +700,20 @@ def submit_floorplan():
                 upsert=True
             )
             
-            print(f"Floorplan {floorplan_id} with {len(seats)} seats stored in MongoDB")
-            print(f"Stream {stream_id} created and associated")
+            log.info("Floorplan stored in MongoDB", extra={"floorplan_id": floorplan_id, "seats": len(seats)})
+            log.info("Stream created and associated", extra={"stream_id": stream_id})
+            stored = True
             
         except Exception as e:
-            print(f"Failed to store in MongoDB: {e}")
+            log.warning("Failed to store in MongoDB: %s", e)
     
     # Start background processing thread for this stream
-    thread = threading.Thread(
-        target=process_stream,
-        args=(stream_id, stream_url, active_streams, occupancy_data,
-              seats, SCREENSHOTS_DIR, SCREENSHOT_INTERVAL,
-              predict_occupancy, mongo, MONGO_AVAILABLE),
-        daemon=True
-    )
-    thread.start()
-    stream_threads[stream_id] = thread
+    # (in cluster mode whichever node claims the stream document starts it,
+    # so without the document nothing would ever process it)
+    if not cluster:
+        start_stream_worker(stream_info)
+    elif not stored:
+        return jsonify({"error": "Failed to store stream; no cluster node can pick it up"}), 503
     
     return jsonify({
         "message": "Floorplan and stream configuration saved",
@@ -373,11 +733,14 @@ def save_seat_mappings(stream_id):
         mappings = data.get('mappings', {})
         
         # 1. Update local memory so the app keeps working
-        if stream_id in active_streams:
-            active_streams[stream_id]['seat_mappings'] = mappings
+        # (in cluster mode the stream may be owned by another node; it picks
+        # up the new coordinates from MongoDB on its next heartbeat)
+        stream_info = get_stream_info(stream_id)
+        if stream_info is not None:
+            stream_info['seat_mappings'] = mappings
             
-            if 'coordinates' in active_streams[stream_id]:
-                for coord in active_streams[stream_id]['coordinates']:
+            if 'coordinates' in stream_info:
+                for coord in stream_info['coordinates']:
                     seat_id = coord.get('id')
                     if seat_id in mappings and mappings[seat_id]:
                         mapping = mappings[seat_id]
@@ -390,6 +753,8 @@ def save_seat_mappings(stream_id):
                         coord['camera_y'] = None
                         coord['camera_width'] = None
                         coord['camera_height'] = None
+                # Coordinates were edited in place; tell the stream thread to rebuild its seat table
+                stream_info['layout_version'] = stream_info.get('layout_version', 0) + 1
             
         # 2. Attempt MongoDB save only if available
         if mongo:
@@ -398,14 +763,14 @@ def save_seat_mappings(stream_id):
                     {'_id': stream_id},
                     {'$set': {
                         'seat_mappings': mappings,
-                        'coordinates': active_streams[stream_id].get('coordinates', []) if stream_id in active_streams else []
+                        'coordinates': stream_info.get('coordinates', []) if stream_info is not None else []
                     }},
                     upsert=True
                 )
             except Exception as e:
-                print(f"MongoDB save failed, but memory updated: {e}")
+                log.warning("MongoDB save failed, but memory updated: %s", e)
 
-        updated_seats = active_streams[stream_id].get('coordinates', []) if stream_id in active_streams else []
+        updated_seats = stream_info.get('coordinates', []) if stream_info is not None else []
         return jsonify({
             "status": "success", 
             "message": "Mappings saved locally",
@@ -413,7 +778,7 @@ def save_seat_mappings(stream_id):
             "updated_seats": updated_seats
         })
     except Exception as e:
-        print(f"Critical Error: {e}")
+        log.exception("Critical Error")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route("/floorplans", methods=["GET"])
@@ -449,9 +814,10 @@ def get_floorplan(floorplan_id):
 @app.route("/streams", methods=["GET"])
 def get_streams():
     """Get all active streams."""
+    streams = cluster.list_streams() if cluster else list(active_streams.values())
     return jsonify({
-        "streams": list(active_streams.values()),
-        "count": len(active_streams)
+        "streams": streams,
+        "count": len(streams)
     })
 
 @app.route("/streams", methods=["POST"])
@@ -475,9 +841,8 @@ def add_stream():
         "coordinates": DUMMY_COORDINATES
     }
     
-    active_streams[stream_id] = stream_info
-    
     # Store in MongoDB if available
+    stored = False
     if MONGO_AVAILABLE and mongo:
         try:
             stream_doc = {**stream_info, "_id": stream_id}
@@ -486,20 +851,18 @@ def add_stream():
                 {"$set": stream_doc}, 
                 upsert=True
             )
-            print(f"✅ Stream {stream_id} stored in MongoDB")
+            log.info("Stream stored in MongoDB", extra={"stream_id": stream_id})
+            stored = True
         except Exception as e:
-            print(f"⚠️ Failed to store stream in MongoDB: {e}")
+            log.warning("Failed to store stream in MongoDB: %s", e)
     
     # Start background processing thread
-    thread = threading.Thread(
-        target=process_stream,
-        args=(stream_id, stream_url, active_streams, occupancy_data,
-              DUMMY_COORDINATES, SCREENSHOTS_DIR, SCREENSHOT_INTERVAL,
-              predict_occupancy, mongo, MONGO_AVAILABLE),
-        daemon=True
-    )
-    thread.start()
-    stream_threads[stream_id] = thread
+    # (in cluster mode whichever node claims the stream document starts it,
+    # so without the document nothing would ever process it)
+    if not cluster:
+        start_stream_worker(stream_info)
+    elif not stored:
+        return jsonify({"error": "Failed to store stream; no cluster node can pick it up"}), 503
     
     return jsonify({
         "message": "Stream added and processing started",
@@ -509,28 +872,32 @@ def add_stream():
 @app.route("/streams/<stream_id>", methods=["DELETE"])
 def remove_stream(stream_id):
     """Stop and remove a stream."""
-    if stream_id not in active_streams:
+    if get_stream_info(stream_id) is None:
         return jsonify({"error": "Stream not found"}), 404
     
-    active_streams[stream_id]["active"] = False
-    del active_streams[stream_id]
-    
-    if stream_id in occupancy_data:
-        del occupancy_data[stream_id]
+    stop_stream_worker(stream_id)
+    if cluster:
+        cluster.remove_stream(stream_id)
+    elif MONGO_AVAILABLE and mongo:
+        # Otherwise the stream would be resumed on the next boot
+        try:
+            mongo.db.streams.delete_one({"_id": stream_id})
+            mongo.db.occupancy.delete_one({"_id": stream_id})
+        except Exception as e:
+            log.warning("Failed to remove stream from MongoDB: %s", e, extra={"stream_id": stream_id})
     
     return jsonify({"message": f"Stream {stream_id} stopped and removed"})
 
 @app.route("/streams/<stream_id>/capture", methods=["POST"])
 def manual_capture(stream_id):
     """Manually trigger a capture and prediction for a stream."""
-    if stream_id not in active_streams:
+    stream_info = get_stream_info(stream_id)
+    if stream_info is None:
         return jsonify({"error": "Stream not found"}), 404
     
-    stream_url = active_streams[stream_id]["url"]
-    frame = capture_frame_from_stream(stream_url)
-    
-    if frame is None:
-        return jsonify({"error": "Failed to capture frame"}), 500
+    frame, error = grab_frame(stream_info["url"])
+    if error:
+        return error
     
     # Save screenshot
     screenshot_path = save_screenshot(frame, stream_id, SCREENSHOTS_DIR)
@@ -541,7 +908,9 @@ def manual_capture(stream_id):
     # Get frame dimensions
     height, width = frame.shape[:2]
     
-    # Build results with coordinates
+    # Build results with coordinates, merged over the last sweep's seats
+    snapshot = occupancy_store.get(stream_id)
+    seats = snapshot.seats_by_id() if snapshot else {}
     results = []
     for coord in DUMMY_COORDINATES:
         seat_result = {
@@ -555,7 +924,8 @@ def manual_capture(stream_id):
             "confidence": prediction["confidence"]
         }
         results.append(seat_result)
-        occupancy_data[stream_id][coord["id"]] = seat_result
+        seats[coord["id"]] = seat_result
+    occupancy_store.publish(stream_id, seats.values())
     
     return jsonify({
         "stream_id": stream_id,
@@ -564,97 +934,267 @@ def manual_capture(stream_id):
         "seats": results
     })
 
+# Frame responses
+
+def grab_frame(stream_url):
+    """Capture a frame within CAPTURE_DEADLINE.
+    
+    Returns (frame, None), or (None, error_response) with 504 when the source
+    is too slow, 503 when every capture slot is busy and 500 when no frame came.
+    """
+    try:
+        frame = capture_service.grab(stream_url, CAPTURE_DEADLINE)
+    except CaptureTimeout as e:
+        return None, (jsonify({"error": str(e)}), 504)
+    except CaptureUnavailable as e:
+        return None, (jsonify({"error": str(e)}), 503)
+    if frame is None:
+        return None, (jsonify({"error": "Failed to capture frame"}), 500)
+    return frame, None
+
+def _frame_options(data=None):
+    """Read width, quality and format from the query string (or a JSON body).
+    
+    Returns (options, None), or (None, error_response) with 400 when width or
+    quality is not a positive integer.
+    """
+    data = data or {}
+    options = {"raw": (request.args.get("format") or data.get("format")) == "jpeg"}
+    for key in ("width", "quality"):
+        value = request.args.get(key) or data.get(key)
+        if value is None or value == "":
+            options[key] = None
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = 0
+        if value <= 0:
+            return None, (jsonify({"error": f"{key} must be a positive integer"}), 400)
+        options[key] = value
+    return options, None
+
+def _fresh_pyramid(stream_id):
+    """The stream worker's latest frame, if it is recent enough to serve instead of a live grab."""
+    pyramid = frame_pyramids.get(stream_id)
+    if pyramid is not None and time.time() - pyramid.timestamp <= FRAME_MAX_AGE:
+        return pyramid
+    return None
+
+def _raw_frame_response(pyramid, options):
+    """Serve a frame as image/jpeg instead of base64 JSON."""
+    body, width, height = pyramid.jpeg(options["width"], options["quality"])
+    return Response(body, mimetype="image/jpeg", headers={
+        "X-Frame-Width": str(width),
+        "X-Frame-Height": str(height),
+        "X-Source-Width": str(pyramid.width),
+        "X-Source-Height": str(pyramid.height),
+    })
+
 @app.route("/streams/<stream_id>/frame", methods=["GET"])
 def get_stream_frame(stream_id):
-    """Get a single frame from a stream as base64 for display."""
-    if stream_id not in active_streams:
-        return jsonify({"error": "Stream not found"}), 404
+    """Get a single frame from a stream as base64 for display.
     
-    stream_url = active_streams[stream_id]["url"]
-    frame = capture_frame_from_stream(stream_url)
+    Optional query params: width (thumbnail width), quality (JPEG quality),
+    format=jpeg (raw image/jpeg). width/height in the response stay the native
+    frame size that seat coordinates refer to. The stream worker's latest
+    frame is served while it is fresh; otherwise a live one is captured.
+    """
+    stream_info = get_stream_info(stream_id)
+    if stream_info is None:
+        return jsonify({"error": "Stream not found"}), 404
+    options, error = _frame_options()
+    if error:
+        return error
     
-    if frame is None:
-        return jsonify({"error": "Failed to capture frame"}), 500
+    stream_url = stream_info["url"]
+    pyramid = _fresh_pyramid(stream_id)
+    if pyramid is None:
+        frame, error = grab_frame(stream_url)
+        if error:
+            return error
+        pyramid = FramePyramid(frame)
+        if stream_id in active_streams:
+            frame_pyramids[stream_id] = pyramid
+    if options["raw"]:
+        return _raw_frame_response(pyramid, options)
     
     # Convert frame to JPEG base64
-    _, buffer = cv2.imencode('.jpg', frame)
+    buffer, image_width, image_height = pyramid.jpeg(options["width"], options["quality"])
     frame_base64 = base64.b64encode(buffer).decode('utf-8')
     
-    # Get stream info including seats
-    stream_info = active_streams[stream_id]
-    
     return jsonify({
         "stream_id": stream_id,
         "stream_name": stream_info.get("name", ""),
         "stream_url": stream_url,
         "frame": frame_base64,
-        "width": frame.shape[1],
-        "height": frame.shape[0],
+        "width": pyramid.width,
+        "height": pyramid.height,
+        "image_width": image_width,
+        "image_height": image_height,
         "seats": stream_info.get("coordinates", []),
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.fromtimestamp(pyramid.timestamp).isoformat()
     })
 
 @app.route("/frame-from-url", methods=["POST"])
 def get_frame_from_url():
-    """Get a single frame from any stream URL as base64."""
+    """Get a single frame from any stream URL as base64.
+    
+    Accepts the same width/quality/format options as /streams/<id>/frame,
+    in the JSON body or the query string.
+    """
     data = request.get_json()
     stream_url = data.get("url", "")
     
     if not stream_url:
         return jsonify({"error": "Stream URL is required"}), 400
+    options, error = _frame_options(data)
+    if error:
+        return error
     
-    frame = capture_frame_from_stream(stream_url)
+    frame, error = grab_frame(stream_url)
+    if error:
+        return error
     
-    if frame is None:
-        return jsonify({"error": "Failed to capture frame from URL"}), 500
+    pyramid = FramePyramid(frame)
+    if options["raw"]:
+        return _raw_frame_response(pyramid, options)
     
     # Convert frame to JPEG base64
-    _, buffer = cv2.imencode('.jpg', frame)
+    buffer, image_width, image_height = pyramid.jpeg(options["width"], options["quality"])
     frame_base64 = base64.b64encode(buffer).decode('utf-8')
     
     return jsonify({
         "frame": frame_base64,
-        "width": frame.shape[1],
-        "height": frame.shape[0],
+        "width": pyramid.width,
+        "height": pyramid.height,
+        "image_width": image_width,
+        "image_height": image_height,
         "timestamp": datetime.now().isoformat()
     })
 
+def _cached_json_response(key, version, build):
+    """Serve a body cached per snapshot version, answering If-None-Match with 304."""
+    body = occupancy_store.body(key, version, build)
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(occupancy_store.etag(version))
+    return response.make_conditional(request)
+
 @app.route("/occupancy", methods=["GET"])
 def get_occupancy():
     """Get current occupancy status for all streams."""
-    return jsonify({
+    version, snapshots = occupancy_store.current()
+    return _cached_json_response("__all__", version, lambda: {
         "timestamp": datetime.now().isoformat(),
-        "streams": dict(occupancy_data),
+        "version": version,
+        "streams": {sid: snap.seats_by_id() for sid, snap in snapshots.items()},
         "coordinates": DUMMY_COORDINATES
     })
 
 @app.route("/occupancy/<stream_id>", methods=["GET"])
 def get_stream_occupancy(stream_id):
     """Get occupancy status for a specific stream."""
-    if stream_id not in active_streams:
+    if get_stream_info(stream_id) is None:
         return jsonify({"error": "Stream not found"}), 404
     
-    return jsonify({
+    snapshot = occupancy_store.get(stream_id)
+    if snapshot is None:
+        return jsonify({
+            "stream_id": stream_id,
+            "timestamp": datetime.now().isoformat(),
+            "version": 0,
+            "seats": {},
+            "coordinates": DUMMY_COORDINATES
+        })
+    
+    return _cached_json_response(stream_id, snapshot.version, lambda: {
         "stream_id": stream_id,
-        "timestamp": datetime.now().isoformat(),
-        "seats": occupancy_data.get(stream_id, {}),
+        "timestamp": snapshot.timestamp,
+        "version": snapshot.version,
+        "seats": snapshot.seats_by_id(),
         "coordinates": DUMMY_COORDINATES
     })
 
+@app.route("/streams/<stream_id>/recent", methods=["GET"])
+def get_stream_recent(stream_id):
+    """List the frames in a stream's ring buffer, newest first.
+    
+    Other processes on this host can read the same frames without copying
+    by attaching to shm_name with FrameRing.attach(stream_id).
+    """
+    if get_stream_info(stream_id) is None:
+        return jsonify({"error": "Stream not found"}), 404
+    ring = frame_rings.get(stream_id)
+    if ring is None:
+        return jsonify({"error": "No recent frames for this stream on this node"}), 404
+    
+    return jsonify({
+        "stream_id": stream_id,
+        "shm_name": ring.name,
+        "capacity": ring.capacity,
+        "width": ring.width,
+        "height": ring.height,
+        "frames": [
+            {
+                "index": age,
+                "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+                "source_width": source_width,
+                "source_height": source_height,
+            }
+            for age, timestamp, (source_width, source_height) in ring.entries()
+        ],
+    })
+
+@app.route("/streams/<stream_id>/recent/<int:index>", methods=["GET"])
+def get_stream_recent_frame(stream_id, index):
+    """Get one frame from the ring buffer, 0 being the newest.
+    
+    Accepts the same width/quality/format options as /streams/<id>/frame.
+    width/height are the ring's (downscaled) size; seat coordinates refer to
+    source_width/source_height.
+    """
+    options, error = _frame_options()
+    if error:
+        return error
+    ring = frame_rings.get(stream_id)
+    entry = ring.read(index) if ring else None
+    if entry is None:
+        return jsonify({"error": "Frame not in the ring buffer"}), 404
+    
+    frame, timestamp, (source_width, source_height) = entry
+    pyramid = FramePyramid(frame, timestamp=timestamp)
+    if options["raw"]:
+        return _raw_frame_response(pyramid, options)
+    
+    buffer, image_width, image_height = pyramid.jpeg(options["width"], options["quality"])
+    return jsonify({
+        "stream_id": stream_id,
+        "index": index,
+        "frame": base64.b64encode(buffer).decode('utf-8'),
+        "width": pyramid.width,
+        "height": pyramid.height,
+        "image_width": image_width,
+        "image_height": image_height,
+        "source_width": source_width,
+        "source_height": source_height,
+        "timestamp": datetime.fromtimestamp(timestamp).isoformat()
+    })
+
 @app.route("/streams/<stream_id>/latest", methods=["GET"])
 def get_stream_latest(stream_id):
-    """Get the latest occupancy snapshot for a stream (used by heatmap)."""
-    if stream_id not in active_streams:
+    """Get the latest occupancy snapshot for a stream (used by heatmap).
+    
+    Accepts the same width/quality/format options as /streams/<id>/frame
+    for the background frame.
+    """
+    import cv2
+    
+    stream_info = get_stream_info(stream_id)
+    if stream_info is None:
         return jsonify({"error": "Stream not found"}), 404
 
-    stream_info = active_streams[stream_id]
-    seats_dict = occupancy_data.get(stream_id, {})
-
-    # Convert seat dict to array
-    if isinstance(seats_dict, dict):
-        seats_list = list(seats_dict.values())
-    else:
-        seats_list = seats_dict
+    snapshot = occupancy_store.get(stream_id)
+    seats_list = list(snapshot.seats) if snapshot else []
 
     # If no occupancy data yet, build from coordinates
     if not seats_list:
@@ -671,19 +1211,33 @@ def get_stream_latest(stream_id):
                 "confidence": 0,
             })
 
-    # Try to capture a live frame for the heatmap background
+    # Heatmap background: reuse the stream worker's latest frame while it is
+    # fresh, otherwise try to capture a live one
     frame_base64 = None
+    frame_error = None
     frame_width = 640
     frame_height = 480
-    try:
-        stream_url = stream_info["url"]
-        frame = capture_frame_from_stream(stream_url)
-        if frame is not None:
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_base64 = base64.b64encode(buffer).decode('utf-8')
-            frame_height, frame_width = frame.shape[:2]
-    except Exception as e:
-        print(f"Frame capture failed for heatmap: {e}")
+    image_width = None
+    image_height = None
+    options, error = _frame_options()
+    if error:
+        return error
+    pyramid = _fresh_pyramid(stream_id)
+    if pyramid is None:
+        frame, error = grab_frame(stream_info["url"])
+        pyramid = FramePyramid(frame) if frame is not None else None
+        if error:
+            if options["raw"]:
+                return error
+            # The seats are still useful without a background frame
+            frame_error = error[0].get_json()["error"]
+            log.warning("Frame capture failed for heatmap: %s", frame_error, extra={"stream_id": stream_id})
+    if options["raw"]:
+        return _raw_frame_response(pyramid, options)
+    if pyramid is not None:
+        buffer, image_width, image_height = pyramid.jpeg(options["width"], options["quality"])
+        frame_base64 = base64.b64encode(buffer).decode('utf-8')
+        frame_width, frame_height = pyramid.width, pyramid.height
 
     # Retrieve the floorplan image for this stream
     floorplan_base64 = None
@@ -700,7 +1254,7 @@ def get_stream_latest(stream_id):
                     floorplan_width = fp_doc.get("image_width", 0)
                     floorplan_height = fp_doc.get("image_height", 0)
             except Exception as e:
-                print(f"Failed to load floorplan from MongoDB: {e}")
+                log.warning("Failed to load floorplan from MongoDB: %s", e)
 
         # Fallback: load from disk if not found in MongoDB
         if not floorplan_base64:
@@ -717,7 +1271,7 @@ def get_stream_latest(stream_id):
                             floorplan_height, floorplan_width = fp_img.shape[:2]
                         break
             except Exception as e:
-                print(f"Failed to load floorplan from disk: {e}")
+                log.warning("Failed to load floorplan from disk: %s", e)
 
     return jsonify({
         "stream_id": stream_id,
@@ -725,13 +1279,46 @@ def get_stream_latest(stream_id):
         "timestamp": datetime.now().isoformat(),
         "seats": seats_list,
         "frame": frame_base64,
+        "frame_error": frame_error,
         "frame_width": frame_width,
         "frame_height": frame_height,
+        "image_width": image_width,
+        "image_height": image_height,
         "floorplan": floorplan_base64,
         "floorplan_width": floorplan_width,
         "floorplan_height": floorplan_height,
     })
 
+@app.route("/streams/<stream_id>/heatmap", methods=["GET"])
+def get_stream_heatmap(stream_id):
+    """Get the time-averaged occupancy heatmap of a stream.
+    
+    format=grid (default) returns the density grid as base64 uint8 values in
+    floorplan coordinates; format=png returns a colormapped RGBA overlay,
+    scaled to the optional width.
+    """
+    if get_stream_info(stream_id) is None:
+        return jsonify({"error": "Stream not found"}), 404
+    
+    accumulator = heatmaps.get(stream_id)
+    if accumulator is None:
+        return jsonify({"error": "No occupancy sweeps yet"}), 404
+    
+    if request.args.get("format") == "png":
+        width = request.args.get("width")
+        if width is not None:
+            width = request.args.get("width", type=int)
+            if width is None or not 1 <= width <= MAX_PNG_SIZE:
+                return jsonify({"error": f"width must be an integer between 1 and {MAX_PNG_SIZE}"}), 400
+        png = accumulator.to_png(width)
+        return Response(png, mimetype="image/png")
+    
+    return jsonify({
+        "stream_id": stream_id,
+        "timestamp": datetime.now().isoformat(),
+        **accumulator.to_grid()
+    })
+
 # Removed /occupancy/history endpoint - occupancy history is not stored in DB
 
 if __name__ == "__main__":
@@ -739,11 +1326,19 @@ if __name__ == "__main__":
     print("Starting Occupancy Detection Server")
     print("=" * 60)
     
-    load_model()
+    # With the reloader this process only watches files and restarts the child
+    # it spawns (WERKZEUG_RUN_MAIN=true), which is the one that serves requests
+    # and runs the streams. Starting up here as well would run every stream twice.
+    use_reloader = not CLUSTER_MODE
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
     
     print(f"Screenshots will be saved to: {SCREENSHOTS_DIR}")
     print(f"Screenshot interval: {SCREENSHOT_INTERVAL} seconds")
-    print(f"Server starting at http://127.0.0.1:5001")
+    if CLUSTER_MODE:
+        print(f"Cluster mode: node {NODE_ID}")
+    print(f"Server starting at http://127.0.0.1:{SERVER_PORT}")
     print("=" * 60)
     
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    # The reloader would start a second process with the same NODE_ID
+    app.run(debug=True, host='0.0.0.0', port=SERVER_PORT, use_reloader=use_reloader)
\ No newline at end of file
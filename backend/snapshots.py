@@ -0,0 +1,206 @@
+"""
+Occupancy Snapshot Module
+
+This module handles:
+1. Publishing an immutable, versioned snapshot of each stream after every sweep
+2. Caching the serialized JSON body of each snapshot so polls do not re-serialize
+3. ETags keyed on the snapshot version
+4. Persisting the latest snapshot of each stream on a background thread
+
+Stream threads never mutate a published snapshot; they build a new one and
+swap it in. Readers grab the current snapshot (or the cached body) without
+locking and never see a half-written sweep.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from seat_table import SeatTable
+
+log = logging.getLogger("snapshots")
+
+
+class OccupancySnapshot:
+    """One sweep of one stream. Treat as read-only once published.
+
+    Holds a SeatTable copy; the per-seat dicts are only built the first time
+    something (a response body, MongoDB persistence) asks for them.
+    """
+
+    __slots__ = ("stream_id", "version", "table", "timestamp", "_seats")
+
+    def __init__(self, stream_id, version, table, timestamp, seats=None):
+        self.stream_id = stream_id
+        self.version = version
+        self.table = table
+        self.timestamp = timestamp
+        self._seats = tuple(seats) if seats is not None else None
+
+    @property
+    def seats(self):
+        if self._seats is None:
+            self._seats = tuple(self.table.to_dicts())
+        return self._seats
+
+    def seats_by_id(self):
+        return {seat.get("id"): seat for seat in self.seats}
+
+
+class SnapshotStore:
+    """Latest snapshot per stream plus per-version cached response bodies."""
+
+    def __init__(self, dumps=json.dumps):
+        self._dumps = dumps
+        self._lock = threading.Lock()
+        # (version, {stream_id: OccupancySnapshot}); the pair is replaced, never mutated
+        self._state = (0, {})
+        self._bodies = {}     # cache key -> (version, bytes)
+        # Distinguishes versions of this process from those of a restarted one
+        self._epoch = uuid.uuid4().hex[:8]
+
+    def publish(self, stream_id, seats):
+        """Swap in a new snapshot for a stream and return it.
+
+        seats is a SeatTable the caller will not touch again (e.g. table.copy())
+        or a list of per-seat dicts.
+        """
+        if isinstance(seats, SeatTable):
+            table, seat_dicts = seats, None
+        else:
+            seat_dicts = list(seats)
+            table = SeatTable.from_seats(seat_dicts)
+        with self._lock:
+            version, snapshots = self._state
+            snapshot = OccupancySnapshot(stream_id, version + 1, table,
+                                         datetime.now().isoformat(), seat_dicts)
+            snapshots = dict(snapshots)
+            snapshots[stream_id] = snapshot
+            self._state = (version + 1, snapshots)
+        return snapshot
+
+    def remove(self, stream_id):
+        with self._lock:
+            version, snapshots = self._state
+            if stream_id not in snapshots:
+                return
+            snapshots = dict(snapshots)
+            del snapshots[stream_id]
+            self._state = (version + 1, snapshots)
+            self._bodies.pop(stream_id, None)
+
+    def get(self, stream_id):
+        return self._state[1].get(stream_id)
+
+    def current(self):
+        """(version, snapshots) for all streams, read atomically."""
+        return self._state
+
+    def etag(self, version):
+        return f"{self._epoch}-{version}"
+
+    def body(self, key, version, build):
+        """Serialized body for (key, version), built with build() on a cache miss."""
+        cached = self._bodies.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        body = self._dumps(build())
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self._bodies[key] = (version, body)
+        return body
+
+
+class SnapshotWriter:
+    """Hands the latest snapshot of each stream to write(stream_id, snapshot) on its own thread.
+
+    Stream threads only drop their snapshot off, so a slow or unreachable
+    database never stalls a sweep. A newer snapshot replaces a pending one,
+    so at most one write per stream is queued, and a version that was already
+    written is not written again; touch(stream_id, snapshot), if given, is
+    called for it instead, so readers can still tell the sweep happened. A
+    stream is written at most once every min_interval seconds; in between,
+    its snapshots only replace each other.
+    """
+
+    def __init__(self, write, min_interval=0, touch=None):
+        self._write = write
+        self._touch = touch
+        self.min_interval = min_interval
+        self._pending = {}  # stream_id -> newest unwritten snapshot
+        self._written = {}  # stream_id -> (version, monotonic time) of the last write
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, snapshot):
+        with self._cond:
+            if self._stopping:
+                return
+            self._pending[snapshot.stream_id] = snapshot
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, stream_id):
+        """Forget a removed stream so a queued snapshot is not written after it."""
+        with self._cond:
+            self._pending.pop(stream_id, None)
+            self._written.pop(stream_id, None)
+
+    def _next_batch(self):
+        """Pending snapshots whose stream is due, waiting until there are any."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    if not self._pending:
+                        return None
+                    due = list(self._pending)
+                    break
+                now = time.monotonic()
+                wait = None
+                due = []
+                for stream_id in self._pending:
+                    last = self._written.get(stream_id)
+                    remaining = last[1] + self.min_interval - now if last else 0
+                    if remaining <= 0:
+                        due.append(stream_id)
+                    elif wait is None or remaining < wait:
+                        wait = remaining
+                if due:
+                    break
+                self._cond.wait(wait)
+            batch = [self._pending.pop(stream_id) for stream_id in due]
+            return [
+                (s, self._written.get(s.stream_id, (None,))[0] == s.version)
+                for s in batch
+            ]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for snapshot, repeated in batch:
+                if repeated and not self._touch:
+                    continue
+                try:
+                    (self._touch if repeated else self._write)(snapshot.stream_id, snapshot)
+                except Exception as e:
+                    log.warning("Failed to persist occupancy: %s", e, extra={"stream_id": snapshot.stream_id})
+                    continue
+                with self._cond:
+                    self._written[snapshot.stream_id] = (snapshot.version, time.monotonic())
+
+    def stop(self, timeout=5):
+        """Write what is pending (waiting at most timeout seconds) and stop the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
@@ -0,0 +1,114 @@
+"""
+Frame Thumbnail Module
+
+This module handles:
+1. Building an image pyramid of a captured frame at the configured widths
+2. Encoding each level to JPEG once and caching the bytes
+3. Picking the variant that best matches a requested width and quality
+
+Seat coordinates are always in native frame pixels; a thumbnail only changes
+the size of the image that is sent, so clients scale by native_width / width.
+
+A pyramid kept per stream would otherwise pin the native frame (about 25 MB
+for 4K) for as long as the stream runs, so prebuild() encodes the native
+level and then keeps only the largest downscaled ndarray. A native request at
+another quality decodes the cached native JPEG.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+PYRAMID_WIDTHS = (320, 640, 1280)  # downscaled levels, native resolution is always available
+DEFAULT_QUALITY = 95  # cv2.imencode's default, so unparameterized requests are unchanged
+MIN_QUALITY = 10
+QUALITY_STEP = 5  # requested qualities are snapped to a multiple of this to bound the cache
+
+
+def normalize_quality(quality):
+    if not quality:
+        return DEFAULT_QUALITY
+    quality = int(round(quality / QUALITY_STEP) * QUALITY_STEP)
+    return max(MIN_QUALITY, min(100, quality))
+
+
+class FramePyramid:
+    """Downscaled copies of one frame, each encoded to JPEG at most once per quality."""
+
+    def __init__(self, frame, widths=PYRAMID_WIDTHS, timestamp=None):
+        self.height, self.width = frame.shape[:2]
+        self.timestamp = timestamp or time.time()
+        self.widths = sorted(w for w in set(widths) if w < self.width) + [self.width]
+        self._levels = {self.width: frame}  # width -> BGR ndarray
+        self._encoded = {}                  # (width, quality) -> JPEG bytes
+        self._lock = threading.Lock()
+
+    def level_width(self, target_width=None):
+        """Smallest level at least target_width wide (native when unset or larger)."""
+        if not target_width:
+            return self.width
+        for width in self.widths:
+            if width >= target_width:
+                return width
+        return self.width
+
+    def _height(self, width):
+        return self.height if width == self.width else max(1, round(self.height * width / self.width))
+
+    def _native(self):
+        """Native ndarray, decoded from its best cached JPEG once it has been released."""
+        level = self._levels.get(self.width)
+        if level is not None:
+            return level
+        import cv2
+
+        quality = max(q for w, q in self._encoded if w == self.width)
+        data = np.frombuffer(self._encoded[(self.width, quality)], dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    def _level(self, width):
+        level = self._levels.get(width)
+        if level is not None:
+            return level
+        if width == self.width:
+            # Not cached again, so a released pyramid stays small
+            return self._native()
+        import cv2
+
+        # Downscale from the smallest level that is already built and larger
+        larger = [w for w in self._levels if w > width]
+        source = self._levels[min(larger)] if larger else self._native()
+        level = cv2.resize(source, (width, self._height(width)), interpolation=cv2.INTER_AREA)
+        self._levels[width] = level
+        return level
+
+    def jpeg(self, target_width=None, quality=None):
+        """Return (jpeg_bytes, width, height) for the best matching level."""
+        width = self.level_width(target_width)
+        quality = normalize_quality(quality)
+        key = (width, quality)
+        with self._lock:
+            encoded = self._encoded.get(key)
+            if encoded is None:
+                import cv2
+
+                level = self._level(width)
+                _, buffer = cv2.imencode('.jpg', level, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                encoded = buffer.tobytes()
+                self._encoded[key] = encoded
+        return encoded, width, self._height(width)
+
+    def prebuild(self, quality=DEFAULT_QUALITY, release=True):
+        """Encode every level, largest first so each is resized from the previous.
+
+        With release, the native ndarray and all but the largest downscaled
+        one are dropped afterwards; later levels are rebuilt from those.
+        """
+        for width in reversed(self.widths):
+            self.jpeg(width, quality)
+        if release:
+            with self._lock:
+                keep = self.widths[-2] if len(self.widths) > 1 else None
+                self._levels = {keep: self._levels[keep]} if keep else {}
+        return self
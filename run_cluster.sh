@@ -0,0 +1,20 @@
+#!/bin/bash
+# Start one MongoDB and N backend nodes in cluster mode (default 2)
+
+NODES=${1:-2}
+
+mkdir -p backend/db
+
+echo "Starting MongoDB..."
+mongod --dbpath ./backend/db &
+sleep 5
+
+cd backend
+source venv/bin/activate
+for i in $(seq 1 $NODES); do
+    PORT=$((5000 + i))
+    echo "Starting node-$i on port $PORT..."
+    CLUSTER_MODE=1 NODE_ID=node-$i PORT=$PORT python server.py &
+done
+
+wait